@@ -4,7 +4,7 @@ import discord
 import re
 
 from discord.ext import commands
-from ..utils import Bot
+from ..utils import Bot, Tags, template_variables
 from ..utils.helpers import Spotify
 
 
@@ -78,6 +78,16 @@ class ExtraCog(commands.Cog, command_attrs=dict(hidden=False)):
             _, repo = messages.split(':')
             await message.channel.send(f"https://github.com/{repo}")
 
+        # tag auto-responders, one pass over the message whatever the number of triggers
+        if message.guild is None or message.author.bot or not message.content:
+            return
+        # a command naming a trigger, e.g. >tag delete_trigger, shouldn't fire it
+        if (await self.bot.get_context(message)).command is not None:
+            return
+        tags = Tags(message.guild.id, message.author.id)
+        if response := await tags.respond(message.content, template_variables(message.author, message.channel, message.guild)):
+            await message.channel.send(response)
+
     async def piston(self, language: str, code: str, version: str) -> dict:
         async with self.bot._session.post(
                 "https://emkc.org/api/v2/piston/execute",
@@ -1,23 +1,158 @@
 from __future__ import annotations
 
+import asyncio
 import discord
+import io
+import math
 import random
 
-from discord.ext import commands
-from ..utils import Leveling, RankCard, RankCardSetting
+from discord.ext import commands, tasks
+from ..utils import GlobalLeaderboard, GlobalLeaderboardPages, LeaderboardCard, LeaderboardPages, LevelCurve, Leveling, LevelingSeasons, LevelingTransfer, Paginator, RankCard, RankCardSetting, RenderPoolBusy, XPHistory, render_xp_history, stream_lines, stream_records
 
 class Level(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.group(name="level", aliases=["lvl", "rank", "card"])
+    async def cog_load(self) -> None:
+        self._flush_xp.start()
+        self._rollup_xp.start()
+        self._run_seasons.start()
+
+    async def cog_unload(self) -> None:
+        self._flush_xp.cancel()
+        self._rollup_xp.cancel()
+        self._run_seasons.cancel()
+        await Leveling.buffer.flush()
+
+    @tasks.loop(seconds=10)
+    async def _flush_xp(self):
+        try:
+            await Leveling.buffer.flush()
+        except Exception as e:
+            # the gains are requeued, so just try again on the next iteration
+            print(f"Failed to flush XP: {e}")
+
+    @tasks.loop(minutes=15)
+    async def _rollup_xp(self):
+        try:
+            await XPHistory.rollup()
+        except Exception as e:
+            # the ledger rows stay until a rollup succeeds
+            print(f"Failed to roll up XP history: {e}")
+
+    @tasks.loop(minutes=10)
+    async def _run_seasons(self):
+        try:
+            for report in await LevelingSeasons.run_due():
+                print(report)
+        except Exception as e:
+            # the schedule only moves on after a successful run, so it's retried next time
+            print(f"Failed to run scheduled season resets or decay: {e}")
+
+    @commands.group(name="level", aliases=["lvl", "rank", "card"], invoke_without_command=True)
     async def _level(self, ctx, member: discord.Member = None):
         member = member or ctx.author
-        leveling = await RankCard(guild_id=ctx.guild.id, author_id=member.id).generate(self.bot)
+        await Leveling.buffer.flush(ctx.guild.id)
+        try:
+            leveling = await RankCard(guild_id=ctx.guild.id, author_id=member.id).generate(self.bot, member)
+        except RenderPoolBusy:
+            return await ctx.send("Too many rank cards are being drawn right now, try again in a bit")
+        except asyncio.TimeoutError:
+            return await ctx.send("Drawing the rank card took too long, try again later")
         if not leveling:
             return await ctx.send("User doesn't exist")
         await ctx.send(file=leveling)
 
+    @_level.command(name="history", aliases=["graph"])
+    async def _history(self, ctx, member: discord.Member = None):
+        member = member or ctx.author
+        daily = await XPHistory.daily(ctx.guild.id, member.id, days=30)
+        if not any(daily):
+            return await ctx.send("No XP history yet")
+        try:
+            image = await RankCard.pool.run(render_xp_history, member.display_name, daily)
+        except (RenderPoolBusy, asyncio.TimeoutError):
+            return await ctx.send("Couldn't draw the graph right now, try again in a bit")
+        await ctx.send(file=discord.File(io.BytesIO(image), filename=f"xp_history_{member.id}.png"))
+
+    @_level.command(name="curve")
+    @commands.has_permissions(manage_guild=True)
+    async def _curve(self, ctx, base: int = None, increment: int = None, factor: float = 1.0):
+        if base is None:
+            curve = await LevelCurve.for_guild(ctx.guild.id)
+            return await ctx.send(f"Level `n` takes `({curve.base} + {curve.increment} * (n - 1)) * {curve.factor} ^ (n - 1)` XP")
+        if base < 1 or (increment or 0) < 0 or not math.isfinite(factor) or not 1 <= factor <= LevelCurve.MAX_FACTOR:
+            return await ctx.send(f"The base has to be positive, the increment can't be negative and the factor has to be between 1 and {LevelCurve.MAX_FACTOR:g}")
+        members = await LevelCurve.configure(ctx.guild.id, base, base if increment is None else increment, factor)
+        await ctx.send(f"Curve updated, recomputed {members} members")
+
+    @_level.command(name="reset")
+    @commands.has_permissions(manage_guild=True)
+    async def _reset(self, ctx):
+        season, members, elapsed = await LevelingSeasons(ctx.guild.id).reset()
+        await ctx.send(f"Archived season {season} and reset {members} members in {elapsed * 1000:.0f}ms")
+
+    @_level.command(name="decay")
+    @commands.has_permissions(manage_guild=True)
+    async def _decay(self, ctx, percent: int, idle_days: int = 14):
+        if not 0 < percent <= 100 or idle_days < 0:
+            return await ctx.send("The percentage has to be between 1 and 100 and the idle days can't be negative")
+        members, elapsed = await LevelingSeasons(ctx.guild.id).decay(percent, idle_days)
+        await ctx.send(f"Decayed {members} members by {percent}% in {elapsed * 1000:.0f}ms")
+
+    @_level.command(name="schedule")
+    @commands.has_permissions(manage_guild=True)
+    async def _schedule(self, ctx, season_days: int = 0, decay_percent: int = 0, idle_days: int = 14):
+        if season_days < 0 or not 0 <= decay_percent <= 100 or idle_days < 0:
+            return await ctx.send("The season length and idle days can't be negative and the percentage has to be between 0 and 100")
+        await LevelingSeasons(ctx.guild.id).schedule(season_days, decay_percent, idle_days)
+        season = f"every {season_days} days" if season_days else "never"
+        decay = f"{decay_percent}% daily after {idle_days} idle days" if decay_percent else "off"
+        await ctx.send(f"Seasons reset {season}, decay is {decay}")
+
+    @_level.command(name="season")
+    async def _season(self, ctx, season: int = None):
+        seasons = LevelingSeasons(ctx.guild.id)
+        if season is None:
+            season = await seasons.current() - 1
+        if not (rows := await seasons.archive(season)):
+            return await ctx.send("That season hasn't been archived")
+        embed = discord.Embed(title=f"Season {season}", color=discord.Color.random())
+        embed.description = "\n".join(
+            f"**{i}.** {self._display_name(ctx.guild, row['user_id'])} - Level {row['level']} ({row['total_xp']} XP)"
+            for i, row in enumerate(rows, start=1)
+        )
+        await ctx.send(embed=embed)
+
+    @_level.command(name="import")
+    @commands.is_owner()
+    async def _import(self, ctx):
+        if not ctx.message.attachments:
+            return await ctx.send("Please attach a `.jsonl` or `.csv` file (optionally `.gz`)")
+        attachment = ctx.message.attachments[0]
+        name = attachment.filename.lower()
+        compressed = name.endswith(".gz")
+        fmt = "csv" if name.removesuffix(".gz").endswith(".csv") else "jsonl"
+
+        message = await ctx.send("Importing...")
+
+        async def progress(imported):
+            await message.edit(content=f"Importing... {imported} members so far")
+
+        try:
+            records = stream_records(stream_lines(attachment.url, compressed=compressed), fmt)
+            imported = await LevelingTransfer(ctx.guild.id).import_records(records, progress)
+        except (ValueError, KeyError) as e:
+            return await message.edit(content=f"Import stopped, the file is malformed: `{e}`")
+        await message.edit(content=f"Imported {imported} members")
+
+    @_level.command(name="export")
+    @commands.is_owner()
+    async def _export(self, ctx, fmt: str = "jsonl"):
+        if fmt not in ("jsonl", "csv"):
+            return await ctx.send("The format has to be `jsonl` or `csv`")
+        await ctx.send(file=await LevelingTransfer(ctx.guild.id).export(fmt))
+
     @_level.command(name="fontcolor", aliases=["fc"])
     async def _fontcolor(self, ctx, color: str = None): #hex code converter
         if not color:
@@ -46,15 +181,81 @@ class Level(commands.Cog):
         await Leveling(ctx.guild.id, ctx.author.id).set_multiplier(multiplier)
         await ctx.send("Multiplier updated")
 
-    @commands.command(name="leaderboard", aliases=["lb"]) # TODO: make leaderboard card (image)
+    @commands.group(name="leaderboard", aliases=["lb"], invoke_without_command=True)
     async def _leaderboard(self, ctx):
-        leaderboard = await Leveling(ctx.guild.id, ctx.author.id).leaderboard()
-        
+        await Leveling.buffer.flush(ctx.guild.id)
+        card = LeaderboardCard(ctx.guild)
+        if not (entries := await card.entries(self.bot)):
+            return await ctx.send("Nobody is on the leaderboard yet")
+
+        try:
+            return await ctx.send(file=await card.generate(entries))
+        except (RenderPoolBusy, asyncio.TimeoutError):
+            # the names are already resolved, so fall back to a plain embed
+            pass
+
         embed = discord.Embed(title="Leaderboard", color=discord.Color.random())
-        for key, user in leaderboard.items(): 
-            embed.add_field(name=f"{int(key)}. {(await self.bot.fetch_user(user['user_id'])).name}", value=f"Level: {user['level']}", inline=False)
+        for entry in entries:
+            embed.add_field(name=f"{entry.rank}. {entry.name}", value=f"Level: {entry.level}", inline=False)
         await ctx.send(embed=embed) 
 
+    @_leaderboard.command(name="weekly", aliases=["week"])
+    async def _weekly(self, ctx):
+        if not (rows := await XPHistory.leaderboard(ctx.guild.id, days=7)):
+            return await ctx.send("Nobody gained XP this week yet")
+
+        embed = discord.Embed(title="Weekly Leaderboard", color=discord.Color.random())
+        for i, (user_id, xp) in enumerate(rows):
+            user = ctx.guild.get_member(user_id) or self.bot.get_user(user_id)
+            embed.add_field(name=f"{i + 1}. {user.display_name if user else user_id}", value=f"XP: {xp}", inline=False)
+        await ctx.send(embed=embed)
+
+    def _display_name(self, guild, user_id):
+        # cached names only, paging shouldn't cost a REST call per row
+        if user := guild.get_member(user_id) or self.bot.get_user(user_id):
+            return user.display_name
+        return f"<@{user_id}>"
+
+    @_leaderboard.command(name="browse", aliases=["pages", "all"])
+    async def _browse(self, ctx):
+        await Leveling.buffer.flush(ctx.guild.id)
+        pages = LeaderboardPages(ctx.guild.id)
+
+        async def fetch_page(number):
+            if not (rows := await pages.page(number)):
+                return None
+            embed = discord.Embed(title="Leaderboard", color=discord.Color.random())
+            embed.description = "\n".join(
+                f"**{row['rank']}.** {self._display_name(ctx.guild, row['user_id'])} - Level {row['level']} ({row['total_xp']} XP)"
+                for row in rows
+            )
+            return embed.set_footer(text=f"Page {number + 1}")
+
+        await Paginator(ctx.author.id, fetch_page).start(ctx)
+
+    @_leaderboard.command(name="global", aliases=["world"])
+    async def _global(self, ctx):
+        # every guild's gains count here, so this shows them as of the last periodic flush
+        pages = GlobalLeaderboardPages()
+
+        async def fetch_page(number):
+            if not (rows := await pages.page(number)):
+                return None
+            embed = discord.Embed(title="Global Leaderboard", color=discord.Color.random())
+            embed.description = "\n".join(
+                f"**{row['rank']}.** {self._display_name(ctx.guild, row['user_id'])} - {row['total_xp']} XP"
+                for row in rows
+            )
+            return embed.set_footer(text=f"Page {number + 1}")
+
+        await Paginator(ctx.author.id, fetch_page).start(ctx)
+
+    @_leaderboard.command(name="rebuild")
+    @commands.is_owner()
+    async def _rebuild(self, ctx):
+        await GlobalLeaderboard.rebuild()
+        await ctx.send("Rebuilt the global leaderboard")
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot:
@@ -1,21 +1,57 @@
 from __future__ import annotations
 
 import discord
-from discord.ext import commands
-from typing import Optional
+from discord import app_commands
+from discord.ext import commands, tasks
+from typing import List, Optional
 
-from ..utils import Bot, Tags
+from ..utils import Bot, Paginator, TagPages, Tags, TagTransfer, stream_lines, stream_records, template_variables
 
 
 class TagCog(commands.Cog):
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
 
-    
-    @commands.group(name="tag", invoke_without_command=True, description="Tags")
+    async def cog_load(self) -> None:
+        self._flush_uses.start()
+        self._evict_names.start()
+
+    async def cog_unload(self) -> None:
+        self._flush_uses.cancel()
+        self._evict_names.cancel()
+        await Tags.usage.flush()
+
+    async def cog_check(self, ctx) -> bool:
+        # every command here needs a guild, a group's checks don't cover its prefix subcommands
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        return True
+
+    @tasks.loop(seconds=30)
+    async def _flush_uses(self):
+        try:
+            await Tags.usage.flush()
+        except Exception as e:
+            # the counts are requeued, so just try again on the next iteration
+            print(f"Failed to flush tag uses: {e}")
+
+    @tasks.loop(minutes=1)
+    async def _evict_names(self):
+        Tags.names.evict_idle()
+
+    async def _tag_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        if interaction.guild is None:
+            return []
+        names = await Tags(interaction.guild.id, interaction.user.id).complete(current)
+        # choices are capped at 100 characters
+        return [app_commands.Choice(name=name, value=name) for name in names if len(name) <= 100]
+
+    @commands.hybrid_group(name="tag", invoke_without_command=True, fallback="get", description="Tags")
+    @commands.guild_only()
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
     async def _tag(self, ctx, *, tag_name: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
-        result = await tag.get(tag_name)
+        result = await tag.get(tag_name, template_variables(ctx.author, ctx.channel, ctx.guild))
 
         return await ctx.send(result)
 
@@ -27,6 +63,7 @@ class TagCog(commands.Cog):
         return await ctx.send(result)
     
     @_tag.command(name="delete", description="Delete a tag", aliases=["remove", 'rm'])
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
     async def _delete(self, ctx, tag_name: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.delete(tag_name)
@@ -34,6 +71,7 @@ class TagCog(commands.Cog):
         return await ctx.send(result)
     
     @_tag.command(name="raw", description="Get a tag without markdown")
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
     async def _raw(self, ctx, tag_name: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.get(tag_name)
@@ -41,13 +79,23 @@ class TagCog(commands.Cog):
         return await ctx.send(discord.utils.escape_markdown(result))
     
     @_tag.command(name="edit", description="Edit a value of tag", aliases=["change"])
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
     async def _edit(self, ctx, tag_name: str, *, new_content: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.edit(tag_name, new_content)
 
         return await ctx.send(result)
     
+    @_tag.command(name="template", description="Render {user}, {args} and {if ...} blocks in a tag")
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
+    async def _template(self, ctx, tag_name: str, enabled: bool = True):
+        tag = Tags(ctx.guild.id, ctx.author.id)
+        result = await tag.set_template(tag_name, enabled)
+
+        return await ctx.send(result)
+
     @_tag.command(name="rename", description="Rename a tag name", aliases=["change_name"])
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
     async def _rename(self, ctx, tag_name: str, new_name: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.rename(tag_name, new_name)
@@ -55,42 +103,130 @@ class TagCog(commands.Cog):
         return await ctx.send(result)
 
     @_tag.command(name="alias", description="Give a tag an alias")
-    async def _alias(self, ctx, tag_name, alias):
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
+    async def _alias(self, ctx, tag_name: str, alias: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.add_alias(tag_name, alias)
 
         return await ctx.send(result)
     
     @_tag.command(name="delete_alias", description="Delete a tag's alias", aliases=["remove_alias", "rm_alias"])
-    async def _delete_alias(self, ctx, tag_name, alias):
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
+    async def _delete_alias(self, ctx, tag_name: str, alias: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.delete_alias(tag_name, alias)
 
         return await ctx.send(result)
 
+    @_tag.command(name="trigger", description="Make a tag respond when a message contains a phrase", aliases=["autorespond"])
+    @commands.has_permissions(manage_guild=True)
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
+    async def _trigger(self, ctx, tag_name: str, *, trigger: str):
+        tag = Tags(ctx.guild.id, ctx.author.id)
+        result = await tag.add_trigger(tag_name, trigger)
+
+        return await ctx.send(result)
+
+    @_tag.command(name="delete_trigger", description="Stop responding to a phrase", aliases=["remove_trigger", "rm_trigger"])
+    @commands.has_permissions(manage_guild=True)
+    async def _delete_trigger(self, ctx, *, trigger: str):
+        tag = Tags(ctx.guild.id, ctx.author.id)
+        result = await tag.delete_trigger(trigger)
+
+        return await ctx.send(result)
+
+    @_tag.command(name="triggers", description="List the server's auto-responders")
+    async def _triggers(self, ctx):
+        tag = Tags(ctx.guild.id, ctx.author.id)
+        if not (rows := await tag.list_triggers()):
+            return await ctx.send("Server doesn't have any auto-responders")
+
+        embed = discord.Embed(title=f"Auto-responders in {ctx.guild.name}", color=discord.Color.random())
+        # kept well under the description limit
+        embed.description = "\n".join(f"`{trigger}` -> `{name}`" for trigger, name in rows[:50])
+        if len(rows) > 50:
+            embed.set_footer(text=f"and {len(rows) - 50} more")
+        return await ctx.send(embed=embed)
+
     @_tag.command(name="search", description="Search for a tag", aliases=["query", "find"])
-    async def _search(self, ctx, *, query):
+    async def _search(self, ctx, *, query: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.query(query)
 
         return await ctx.send(result)
     
+    @_tag.command(name="grep", description="Search the content of tags", aliases=["content"])
+    async def _grep(self, ctx, *, query: str):
+        tag = Tags(ctx.guild.id, ctx.author.id)
+        result = await tag.grep(query)
+
+        return await ctx.send(result)
+    
+    @staticmethod
+    def _paginate(ctx, pages: TagPages, title: str) -> Paginator:
+        async def fetch_page(number):
+            if not (rows := await pages.page(number)):
+                return None
+            embed = discord.Embed(title=title, color=discord.Color.random())
+            embed.description = "\n".join(f"{row['position']}. `{row['tag_name']}` ({row['uses']} uses)" for row in rows)
+            return embed.set_footer(text=f"Page {number + 1}")
+
+        return Paginator(ctx.author.id, fetch_page)
+
+    @_tag.command(name="top", description="The server's most used tags", aliases=["popular"])
+    async def _top(self, ctx, limit: commands.Range[int, 1, 25] = 10):
+        tag = Tags(ctx.guild.id, ctx.author.id)
+        if not (rows := await tag.top(limit)):
+            return await ctx.send("Server doesn't have any tags")
+
+        embed = discord.Embed(title=f"Top tags in {ctx.guild.name}", color=discord.Color.random())
+        embed.description = "\n".join(f"{i+1}. `{name}` ({uses} uses)" for i, (name, uses) in enumerate(rows))
+        return await ctx.send(embed=embed)
+
     @_tag.command(name="all", description="List all server tags", aliases=["list"])
     async def _all(self, ctx):
         tag = Tags(ctx.guild.id, ctx.author.id)
-        result = await tag.list()
+        pages = tag.list()
 
-        return await ctx.send(result)
+        return await self._paginate(ctx, pages, f"Tags in {ctx.guild.name}").start(ctx, "Server doesn't have any tags")
     
+    # prefix only, the file comes in as an attachment of the message
+    @_tag.command(name="import", description="Import tags from a JSON Lines file", with_app_command=False)
+    @commands.has_permissions(manage_guild=True)
+    async def _import(self, ctx):
+        if not ctx.message.attachments:
+            return await ctx.send("Please attach a `.jsonl` file (optionally `.gz`)")
+        attachment = ctx.message.attachments[0]
+        compressed = attachment.filename.lower().endswith(".gz")
+
+        message = await ctx.send("Importing...")
+
+        async def progress(imported, skipped):
+            await message.edit(content=f"Importing... {imported} tags so far, {skipped} skipped")
+
+        try:
+            records = stream_records(stream_lines(attachment.url, compressed=compressed), "jsonl")
+            imported, skipped = await TagTransfer(ctx.guild.id, ctx.author.id).import_records(records, progress)
+        except (ValueError, KeyError) as e:
+            return await message.edit(content=f"Import stopped, the file is malformed: `{e}`")
+        await message.edit(content=f"Imported {imported} tags, skipped {skipped} whose names were taken or that had no content")
+
+    @_tag.command(name="export", description="Export the server's tags as JSON Lines")
+    @commands.has_permissions(manage_guild=True)
+    async def _export(self, ctx):
+        await ctx.send(file=await TagTransfer(ctx.guild.id, ctx.author.id).export())
+
     @_tag.command(name="info", description="Get information on a tag", aliases=["about"])
-    async def _info(self, ctx, tag_name):
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
+    async def _info(self, ctx, tag_name: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         result = await tag.info(tag_name)
 
         return await ctx.send(result)
     
     @_tag.command(name="claim", description="Claim a tag if the author isn't in the server anymore")
-    async def _claim(self, ctx, tag_name):
+    @app_commands.autocomplete(tag_name=_tag_autocomplete)
+    async def _claim(self, ctx, tag_name: str):
         tag = Tags(ctx.guild.id, ctx.author.id)
         owner = await tag.get_owner_id(tag_name)
         if ctx.guild.get_member(owner):
@@ -99,14 +235,15 @@ class TagCog(commands.Cog):
         return await ctx.send("Claimed Tag")
 
     
-    @commands.command(name="tags", description="Get all member's tags")
+    @commands.hybrid_command(name="tags", description="Get all member's tags")
+    @commands.guild_only()
     async def _tags(self, ctx, member: Optional[discord.Member]):
         member = member or ctx.author
 
         tag = Tags(ctx.guild.id, member.id)
-        result = await tag.author()
+        pages = tag.author()
 
-        return await ctx.send(result)
+        return await self._paginate(ctx, pages, f"{member.display_name}'s tags").start(ctx, "Member don't have any tags")
 
 
 async def setup(bot: Bot):
@@ -2,20 +2,51 @@ from tortoise.models import Model
 from tortoise import fields
 
 
+class TagBlob(Model):
+    hash = fields.CharField(max_length=64, unique=True)
+    data = fields.BinaryField()
+    compressed = fields.BooleanField(default=False)
+    size = fields.IntField()
+    refs = fields.IntField(default=0)
+
+    class Meta:
+        table = "Tag Blobs"
+
 class TagModel(Model):
     guild_id = fields.IntField()
     author_id = fields.IntField()
     tag_name = fields.TextField()
-    tag_content = fields.TextField()
+    blob = fields.ForeignKeyField("models.TagBlob", related_name="tags", on_delete=fields.RESTRICT)
     created_at = fields.DatetimeField(null=True, auto_now_add=True)
     uses = fields.IntField(default=0)
-    aliases = fields.TextField(null=True)
+    # variables and blocks in the content are only rendered when the author turned them on
+    template = fields.BooleanField(default=False)
 
     def __str__(self):
-        return self.tag_content
+        return self.tag_name
 
     class Meta:
         table = "Tags"
+        indexes = (("guild_id", "tag_name"), ("guild_id", "author_id", "tag_name"))
+        # the (guild_id, uses DESC, tag_name) index is created in migrations.py, Meta can't express DESC
+
+class TagAlias(Model):
+    guild_id = fields.IntField()
+    alias = fields.TextField()
+    tag = fields.ForeignKeyField("models.TagModel", related_name="tag_aliases", on_delete=fields.CASCADE)
+
+    class Meta:
+        table = "Tag Aliases"
+        unique_together = (("guild_id", "alias"),)
+
+class TagTrigger(Model):
+    guild_id = fields.IntField()
+    trigger = fields.TextField()
+    tag = fields.ForeignKeyField("models.TagModel", related_name="tag_triggers", on_delete=fields.CASCADE)
+
+    class Meta:
+        table = "Tag Triggers"
+        unique_together = (("guild_id", "trigger"),)
 
 class LevelingSystem(Model):
     guild_id = fields.IntField()
@@ -23,6 +54,7 @@ class LevelingSystem(Model):
     xp = fields.IntField(default=0)
     xp_max = fields.IntField(default=100)
     level = fields.IntField(default=0)
+    total_xp = fields.BigIntField(default=0)
     multiplier = fields.IntField(default=1)
     cooldown = fields.TextField(null=True)
     background_url = fields.TextField(null=True)
@@ -30,6 +62,8 @@ class LevelingSystem(Model):
     
     class Meta:
         table = "Leveling System"
+        unique_together = (("guild_id", "user_id"),)
+        # the (guild_id, total_xp DESC, user_id) index is created in migrations.py, Meta can't express DESC
 
 class LevelingSystemCard(Model):
     guild_id = fields.IntField()
@@ -40,4 +74,64 @@ class LevelingSystemCard(Model):
 
     class Meta:
         table = "Leveling System Card"
-    
\ No newline at end of file
+    
+class LevelingCurve(Model):
+    guild_id = fields.IntField(unique=True)
+    base = fields.IntField(default=100)
+    increment = fields.IntField(default=100)
+    factor = fields.FloatField(default=1.0)
+
+    class Meta:
+        table = "Leveling Curve"
+
+class GlobalLeveling(Model):
+    user_id = fields.IntField(unique=True)
+    total_xp = fields.BigIntField(default=0)
+
+    class Meta:
+        table = "Global Leveling"
+        # the (total_xp DESC, user_id) index is created in migrations.py, Meta can't express DESC
+
+class LevelingSeason(Model):
+    guild_id = fields.IntField()
+    season = fields.IntField()
+    user_id = fields.IntField()
+    level = fields.IntField()
+    total_xp = fields.BigIntField()
+    archived_at = fields.IntField()
+
+    class Meta:
+        table = "Leveling Season"
+        indexes = (("guild_id", "season"),)
+
+class LevelingSchedule(Model):
+    guild_id = fields.IntField(unique=True)
+    season_days = fields.IntField(default=0)
+    next_season = fields.IntField(null=True)
+    decay_percent = fields.IntField(default=0)
+    decay_idle_days = fields.IntField(default=14)
+    next_decay = fields.IntField(null=True)
+
+    class Meta:
+        table = "Leveling Schedule"
+
+class XPLedger(Model):
+    guild_id = fields.IntField()
+    user_id = fields.IntField()
+    timestamp = fields.IntField()
+    xp = fields.IntField()
+
+    class Meta:
+        table = "XP Ledger"
+
+class XPRollup(Model):
+    guild_id = fields.IntField()
+    user_id = fields.IntField()
+    period = fields.IntField()
+    bucket = fields.IntField()
+    xp = fields.BigIntField(default=0)
+
+    class Meta:
+        table = "XP Rollup"
+        unique_together = (("guild_id", "user_id", "period", "bucket"),)
+        indexes = (("guild_id", "period", "bucket"),)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import json
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+
+async def has_column(connection: BaseDBAsyncClient, table: str, column: str) -> bool:
+    """Checks whether a table already has a column."""
+    _, rows = await connection.execute_query(f'PRAGMA table_info("{table}")')
+    return any(row["name"] == column for row in rows)
+
+
+async def ensure_index(connection: BaseDBAsyncClient, table: str, name: str, *columns: str, unique: bool = False) -> None:
+    """Creates an index unless the table already has one over exactly these columns.
+
+    Tortoise only creates the indexes declared in a model's ``Meta`` together with
+    its table, so tables that already existed need them created here.
+    """
+    _, indexes = await connection.execute_query(f'PRAGMA index_list("{table}")')
+    for index in indexes:
+        if unique and not index["unique"]:
+            continue
+        _, info = await connection.execute_query(f'PRAGMA index_info("{index["name"]}")')
+        if tuple(column["name"] for column in sorted(info, key=lambda c: c["seqno"])) == columns:
+            return
+    fields = ", ".join(f'"{column}"' for column in columns)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    await connection.execute_script(f'CREATE {kind} IF NOT EXISTS "{name}" ON "{table}" ({fields});')
+
+
+async def leveling_total_xp(connection: BaseDBAsyncClient) -> None:
+    """Adds the ``total_xp`` column to databases created before it existed."""
+    if not await has_column(connection, "Leveling System", "total_xp"):
+        await connection.execute_script(
+            'ALTER TABLE "Leveling System" ADD COLUMN "total_xp" BIGINT NOT NULL DEFAULT 0;'
+            # level L starts after 100 + 200 + ... + 100 * (L - 1) XP
+            'UPDATE "Leveling System" SET "total_xp" = 50 * ("level" - 1) * "level" + "xp";'
+        )
+    # serves rank order and keyset pages, which sort by total XP descending and then user ID ascending
+    await connection.execute_script(
+        'DROP INDEX IF EXISTS "idx_leveling_guild_total_xp";'
+        'CREATE INDEX IF NOT EXISTS "idx_leveling_guild_rank" ON "Leveling System" ("guild_id", "total_xp" DESC, "user_id");'
+    )
+
+
+async def leveling_unique_members(connection: BaseDBAsyncClient) -> None:
+    """Makes ``(guild_id, user_id)`` unique, which XP flushes upsert on.
+
+    Rows duplicated by earlier races are dropped first, keeping each member's
+    row with the most total XP.
+    """
+    _, rows = await connection.execute_query(
+        'SELECT 1 FROM "Leveling System" GROUP BY "guild_id", "user_id" HAVING COUNT(*) > 1 LIMIT 1'
+    )
+    if rows:
+        await connection.execute_script(
+            'BEGIN;'
+            'DELETE FROM "Leveling System" WHERE "id" IN ('
+            'SELECT "id" FROM (SELECT "id", ROW_NUMBER() OVER (PARTITION BY "guild_id", "user_id" ORDER BY "total_xp" DESC, "id") AS "n" '
+            'FROM "Leveling System") WHERE "n" > 1);'
+            # the global totals counted the duplicates too
+            'DELETE FROM "Global Leveling";'
+            'INSERT INTO "Global Leveling" ("user_id", "total_xp") SELECT "user_id", SUM("total_xp") FROM "Leveling System" GROUP BY "user_id";'
+            'COMMIT;'
+        )
+    await ensure_index(connection, "Leveling System", "uid_leveling_guild_user", "guild_id", "user_id", unique=True)
+
+
+async def global_leveling(connection: BaseDBAsyncClient) -> None:
+    """Fills the global leaderboard once for databases that predate it."""
+    await connection.execute_script(
+        'CREATE INDEX IF NOT EXISTS "idx_global_leveling_rank" ON "Global Leveling" ("total_xp" DESC, "user_id");'
+    )
+    _, rows = await connection.execute_query('SELECT 1 FROM "Global Leveling" LIMIT 1')
+    if not rows:
+        await connection.execute_query(
+            'INSERT INTO "Global Leveling" ("user_id", "total_xp") '
+            'SELECT "user_id", SUM("total_xp") FROM "Leveling System" GROUP BY "user_id"'
+        )
+
+
+async def tags_search(connection: BaseDBAsyncClient) -> None:
+    """Creates the full-text index over tags and fills it from the existing ones."""
+    _, rows = await connection.execute_query("SELECT 1 FROM sqlite_master WHERE name = 'Tags Search'")
+    if rows:
+        return
+    # the tag's id is the rowid, guild_id is only stored for filtering
+    await connection.execute_script(
+        'CREATE VIRTUAL TABLE "Tags Search" USING fts5("tag_name", "tag_content", "guild_id" UNINDEXED, tokenize = \'unicode61 remove_diacritics 2\');'
+    )
+    # databases created after tag contents moved to blobs start without tags
+    if await has_column(connection, "Tags", "tag_content"):
+        await connection.execute_script(
+            'INSERT INTO "Tags Search" ("rowid", "tag_name", "tag_content", "guild_id") SELECT "id", "tag_name", "tag_content", "guild_id" FROM "Tags";'
+        )
+
+
+async def tag_aliases(connection: BaseDBAsyncClient) -> None:
+    """Collapses the tag rows that were copied for aliases into ``Tag Aliases``.
+
+    Aliases used to be whole tags with the content copied over, named in the
+    original's ``aliases`` column. Each becomes an alias row pointing at the
+    original, which also takes over its uses.
+    """
+    if not await has_column(connection, "Tags", "aliases"):
+        return
+    # the copies of each original tag that still exist
+    copies = (
+        'SELECT "copy"."id", "copy"."uses", "tag"."id" AS "tag_id", "tag"."guild_id", "tag"."aliases" FROM "Tags" AS "tag" '
+        'JOIN "Tags" AS "copy" ON "copy"."guild_id" = "tag"."guild_id" AND "copy"."tag_name" = "tag"."aliases" AND "copy"."id" != "tag"."id"'
+    )
+    await connection.execute_script(
+        'BEGIN;'
+        f'INSERT OR IGNORE INTO "Tag Aliases" ("guild_id", "alias", "tag_id") SELECT "guild_id", "aliases", "tag_id" FROM ({copies});'
+        f'UPDATE "Tags" SET "uses" = "uses" + (SELECT "copies"."uses" FROM ({copies}) AS "copies" WHERE "copies"."tag_id" = "Tags"."id") '
+        f'WHERE "id" IN (SELECT "tag_id" FROM ({copies}));'
+        f'DELETE FROM "Tags Search" WHERE "rowid" IN (SELECT "id" FROM ({copies}));'
+        f'DELETE FROM "Tags" WHERE "id" IN (SELECT "id" FROM ({copies}));'
+        'ALTER TABLE "Tags" DROP COLUMN "aliases";'
+        'COMMIT;'
+    )
+
+
+async def tags_indexes(connection: BaseDBAsyncClient) -> None:
+    """Adds the indexes tag lookups, keyset listings and popularity ranks walk."""
+    await ensure_index(connection, "Tags", "idx_tags_guild_name", "guild_id", "tag_name")
+    await ensure_index(connection, "Tags", "idx_tags_guild_author_name", "guild_id", "author_id", "tag_name")
+    # serves popularity ranks and >tag top, which sort by uses descending and then name ascending
+    await connection.execute_script(
+        'CREATE INDEX IF NOT EXISTS "idx_tags_guild_rank" ON "Tags" ("guild_id", "uses" DESC, "tag_name");'
+    )
+
+
+async def tag_blobs(connection: BaseDBAsyncClient) -> None:
+    """Moves tag contents out of ``Tags`` into the content-addressed ``Tag Blobs``."""
+    if not await has_column(connection, "Tags", "tag_content"):
+        return
+    # imported here, the utils package imports this module through the bot
+    from ..utils.tag import TagBlobs
+
+    async with in_transaction() as transaction:
+        # single statements, a script would commit the transaction
+        if not await has_column(transaction, "Tags", "blob_id"):
+            await transaction.execute_query(
+                'ALTER TABLE "Tags" ADD COLUMN "blob_id" INT REFERENCES "Tag Blobs" ("id") ON DELETE RESTRICT'
+            )
+        last_id = 0
+        while True:
+            _, rows = await transaction.execute_query(
+                'SELECT "id", "tag_content" FROM "Tags" WHERE "id" > ? ORDER BY "id" LIMIT 1000', [last_id]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            blob_ids = await TagBlobs.acquire_many([row["tag_content"] for row in rows], transaction)
+            await transaction.execute_query(
+                'UPDATE "Tags" SET "blob_id" = json_extract("new"."value", \'$[1]\') FROM json_each(?) AS "new" '
+                'WHERE "Tags"."id" = json_extract("new"."value", \'$[0]\')',
+                [json.dumps([[row["id"], blob_id] for row, blob_id in zip(rows, blob_ids)])],
+            )
+        await transaction.execute_query('ALTER TABLE "Tags" DROP COLUMN "tag_content"')
+
+
+async def tags_template(connection: BaseDBAsyncClient) -> None:
+    """Adds the ``template`` flag, existing tags keep rendering as plain text."""
+    if not await has_column(connection, "Tags", "template"):
+        await connection.execute_script('ALTER TABLE "Tags" ADD COLUMN "template" INT NOT NULL DEFAULT 0;')
+
+
+# run in order on every start, so every step has to be idempotent
+MIGRATIONS = [
+    leveling_total_xp,
+    leveling_unique_members,
+    global_leveling,
+    tags_search,
+    tag_aliases,
+    tags_indexes,
+    tag_blobs,
+    tags_template,
+]
+
+
+async def migrate() -> None:
+    """Brings an existing database up to date with the models."""
+    connection = Tortoise.get_connection("default")
+    for migration in MIGRATIONS:
+        await migration(connection)
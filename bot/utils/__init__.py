@@ -1,6 +1,11 @@
 from .bot import *
+from .cache import *
 from .helpers import *
 from .leveling import *
 from .math import *
+from .paginator import *
 from .rtfm import *
-from .tag import *
\ No newline at end of file
+from .search import *
+from .tag import *
+from .template import *
+from .transfer import *
\ No newline at end of file
@@ -13,6 +13,10 @@ from aiohttp import ClientSession
 from tortoise import Tortoise
 from traceback import format_exception
 
+from .leveling import Leveling, RankCard
+from .tag import Tags
+from ..db.migrations import migrate
+
 
 # from .utils.help import CustomHelpCommand
 
@@ -102,6 +106,7 @@ class Bot(commands.AutoShardedBot):
             modules={'models': ['bot.db.database']}
         )
         await Tortoise.generate_schemas()
+        await migrate()
 
     async def start(self, token: str, *, reconnect: bool = True) -> None:
         await self.tortoise()
@@ -128,8 +133,19 @@ class Bot(commands.AutoShardedBot):
 
 
     async def close(self) -> None:
-        await Tortoise.close_connections()
-        return await super().close()
+        try:
+            # a failed flush loses those pending writes, it mustn't keep the bot from shutting down
+            for name, flush in (("XP", Leveling.buffer.flush), ("tag uses", Tags.usage.flush)):
+                try:
+                    await flush()
+                except Exception as e:
+                    print(f"Failed to flush {name} on close: {e}")
+        finally:
+            RankCard.pool.shutdown()
+            try:
+                await Tortoise.close_connections()
+            finally:
+                await super().close()
 
     def run(self):
         super().run(token=os.getenv("TOKEN"))
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+__all__ = ("CooldownCache", "ByteLRUCache", "TTLCache")
+
+
+class CooldownCache:
+    """A sharded, memory-bounded cooldown cache.
+
+    Every key maps to the monotonic time at which its cooldown ends. Keys are
+    spread over a fixed number of LRU shards so that each shard can be bounded
+    (and evicted) on its own, and an expiry wheel drops finished cooldowns in
+    amortised O(1) instead of scanning the whole cache.
+
+    Args:
+        cooldown: The default cooldown length in seconds.
+        shards: The number of shards keys are spread over.
+        max_size: The maximum number of keys held across all shards.
+        resolution: The width of one expiry wheel slot in seconds.
+    """
+
+    def __init__(self, cooldown: float = 15.0, *, shards: int = 16, max_size: int = 65536, resolution: float = 1.0) -> None:
+        self.cooldown = cooldown
+        self.resolution = resolution
+        self._shards: List[OrderedDict[Hashable, float]] = [OrderedDict() for _ in range(shards)]
+        self._shard_size = max(1, max_size // shards)
+        # one slot more than a full cooldown so a slot is never reused before it expires
+        self._wheel: List[Set[Hashable]] = [set() for _ in range(int(cooldown / resolution) + 2)]
+        self._tick = self._now_tick(time.monotonic())
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.remaining(key) > 0
+
+    def _now_tick(self, now: float) -> int:
+        return int(now / self.resolution)
+
+    def _shard(self, key: Hashable) -> OrderedDict[Hashable, float]:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _advance(self, now: float) -> None:
+        tick = self._now_tick(now)
+        # only finished slots are swept, and never more than the wheel holds since they would just repeat
+        for current in range(max(self._tick, tick - len(self._wheel)), tick):
+            slot = self._wheel[current % len(self._wheel)]
+            for key in slot:
+                shard = self._shard(key)
+                if (expires := shard.get(key)) is not None and expires <= now:
+                    del shard[key]
+            slot.clear()
+        self._tick = max(self._tick, tick)
+
+    def remaining(self, key: Hashable) -> float:
+        """Returns how many seconds are left on a key's cooldown.
+
+        Counts a hit when the key is still cooling down and a miss otherwise.
+
+        Args:
+            key: The key to look up, e.g. ``(guild_id, user_id)``.
+
+        Returns:
+            float: The remaining cooldown, ``0.0`` when the key is free.
+        """
+        now = time.monotonic()
+        self._advance(now)
+
+        shard = self._shard(key)
+        expires = shard.get(key)
+        if expires is None or expires <= now:
+            self.misses += 1
+            return 0.0
+
+        shard.move_to_end(key)
+        self.hits += 1
+        return expires - now
+
+    def touch(self, key: Hashable, cooldown: Optional[float] = None) -> None:
+        """Starts (or restarts) the cooldown of a key.
+
+        Args:
+            key: The key to put on cooldown.
+            cooldown: The cooldown length in seconds, defaults to :attr:`cooldown`.
+
+        Raises:
+            ValueError: ``cooldown`` is longer than :attr:`cooldown`, which the expiry wheel is sized for.
+        """
+        if cooldown is None:
+            cooldown = self.cooldown
+        elif cooldown > self.cooldown:
+            raise ValueError(f"cooldown can't be longer than {self.cooldown} seconds")
+        now = time.monotonic()
+        self._advance(now)
+
+        if cooldown <= 0:
+            return self.discard(key)
+
+        expires = now + cooldown
+        shard = self._shard(key)
+        shard[key] = expires
+        shard.move_to_end(key)
+        self._wheel[self._now_tick(expires) % len(self._wheel)].add(key)
+
+        while len(shard) > self._shard_size:
+            shard.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: Hashable) -> None:
+        """Removes a key's cooldown, if it has one."""
+        self._shard(key).pop(key, None)
+
+    def clear(self) -> None:
+        """Removes every cooldown."""
+        for shard in self._shards:
+            shard.clear()
+        for slot in self._wheel:
+            slot.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """The cache's hit, miss and eviction counters plus its current size."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self)}
+
+
+class ByteLRUCache:
+    """An LRU cache of ``bytes`` values bounded by their total size.
+
+    Args:
+        max_bytes: The maximum combined size of every cached value.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size(self) -> int:
+        """The combined size of every cached value in bytes."""
+        return self._size
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Returns a cached value and marks it as recently used, or ``None``."""
+        if (value := self._data.get(key)) is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: bytes) -> None:
+        """Caches a value, evicting the least recently used ones to make room.
+
+        Values larger than the whole cache are not stored.
+        """
+        if len(value) > self.max_bytes:
+            return
+        if (old := self._data.pop(key, None)) is not None:
+            self._size -= len(old)
+        self._data[key] = value
+        self._size += len(value)
+
+        while self._size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes every cached value."""
+        self._data.clear()
+        self._size = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """The cache's hit, miss and eviction counters plus its current size."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self), "bytes": self._size}
+
+
+class TTLCache:
+    """A size-bounded LRU cache whose entries expire after a fixed time.
+
+    Args:
+        ttl: The number of seconds an entry stays valid.
+        max_size: The maximum number of entries.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 1024) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns a cached value if it hasn't expired, otherwise ``default``."""
+        if (entry := self._data.get(key)) is None or entry[0] <= time.monotonic():
+            self._data.pop(key, None)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Caches a value for :attr:`ttl` seconds."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Removes every entry whose key matches ``predicate``."""
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        self._data.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """The cache's hit and miss counters plus its current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
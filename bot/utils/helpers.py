@@ -4,15 +4,20 @@ import discord
 import asyncio
 import functools
 import datetime
+import multiprocessing
+import os
 import string
+import threading
 
 
 from discord import File
 from discord.ext import commands
 from io import BytesIO
 from cbvx import iml
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image, ImageDraw, ImageFont
-from typing import Any, Callable, Tuple
+from typing import Any, Callable, Optional, Tuple
 
 from discord.ui import View
 
@@ -30,6 +35,89 @@ def executor() -> Callable[[Callable[..., Any]], Any]:
     return outer
 
 
+class RenderPoolBusy(Exception):
+    """Raised when a :class:`RenderPool` already has as many jobs queued as it allows."""
+
+
+class RenderPool:
+    """A bounded process pool for CPU-bound image rendering.
+
+    Jobs run in worker processes so that Pillow work never blocks the event
+    loop and concurrent renders use more than one core. The number of jobs
+    queued or running is capped, and each job has a timeout. A job that times
+    out can't be stopped once a worker picked it up, so it keeps counting
+    towards the cap until it actually finishes.
+
+    Args:
+        max_workers: The number of worker processes, defaults to the CPU count (at most 4).
+        max_queue: The maximum number of jobs queued or running at once.
+        timeout: The number of seconds a job may take before it is abandoned.
+        initializer: Called once in every worker process when it starts.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, *, max_queue: Optional[int] = None, timeout: float = 15.0, initializer: Optional[Callable[[], Any]] = None) -> None:
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue or self.max_workers * 4
+        self.timeout = timeout
+        self.initializer = initializer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight = 0
+        # jobs finish on the executor's thread
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        """The number of jobs currently queued or running."""
+        return self._inflight
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # created lazily so importing this module never starts processes
+        if self._executor is None:
+            # forking a process that already runs threads (aiosqlite's) can copy held locks into the workers
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context(method), initializer=self.initializer
+            )
+        return self._executor
+
+    def _release(self, _future: Any = None) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a picklable function in a worker process.
+
+        Raises:
+            RenderPoolBusy: The queue is full.
+            asyncio.TimeoutError: The job took longer than :attr:`timeout`.
+        """
+        with self._lock:
+            if self._inflight >= self.max_queue:
+                raise RenderPoolBusy(f"{self._inflight} jobs are already queued")
+            self._inflight += 1
+
+        try:
+            try:
+                future = self.executor.submit(func, *args)
+            except BaseException:
+                self._release()
+                raise
+            # released when the job itself is done, not when the wait below gives up on it
+            future.add_done_callback(self._release)
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except BrokenProcessPool:
+            # a worker died, start over with a fresh pool for the next job
+            self.shutdown()
+            raise
+
+    def shutdown(self) -> None:
+        """Stops the worker processes without waiting for queued jobs."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
 class Spotify:
     __slots__ = ("member", "bot", "embed", "regex", "headers", "counter")
 
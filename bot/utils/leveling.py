@@ -1,13 +1,30 @@
 from __future__ import annotations
 
 import aiohttp
+import asyncio
+import hashlib
 import io
+import json
 import discord
+import numpy as np
+import time
 
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
 from PIL import Image, ImageDraw, ImageFont
-from typing import Union
-from ..db.database import LevelingSystem, LevelingSystemCard
-from datetime import datetime
+from matplotlib.figure import Figure
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from ..db.database import GlobalLeveling, LevelingCurve, LevelingSchedule, LevelingSeason, LevelingSystem, LevelingSystemCard, XPLedger, XPRollup
+from .cache import ByteLRUCache, CooldownCache, TTLCache
+from .helpers import RenderPool
+from .transfer import RecordWriter, chunked
+from datetime import datetime, timedelta, timezone
 
 class RankCardSetting:
     def __init__(self, guild_id: int, user_id: int) -> None:
@@ -75,7 +92,339 @@ class RankCardSetting:
         else:
             return "User doesn't exists"
 
+class LevelCurve:
+    """A guild's XP curve as a precomputed table of cumulative thresholds.
+
+    Finishing level ``L`` takes ``(base + increment * (L - 1)) * factor ** (L - 1)``
+    XP, so the defaults reproduce the original 100, 200, 300, ... curve. Every
+    row's level, XP and XP needed are derived from its ``total_xp``, a level
+    lookup is a bisect over the thresholds and a whole guild can be recomputed
+    in one vectorized pass.
+    """
+    MAX_LEVEL = 1000
+    # keeps steep exponential curves inside 64-bit integers
+    MAX_REQUIREMENT = 10 ** 15
+    # factor ** (MAX_LEVEL - 1) stays a finite float up to this
+    MAX_FACTOR = 2.0
+
+    _guilds: OrderedDict[int, LevelCurve] = OrderedDict()
+    MAX_GUILDS = 1024
+
+    def __init__(self, base: int = 100, increment: int = 100, factor: float = 1.0) -> None:
+        self.base = base
+        self.increment = increment
+        self.factor = factor
+
+        levels = np.arange(self.MAX_LEVEL, dtype=np.float64)
+        requirements = (base + increment * levels) * np.power(factor, levels)
+        #: XP needed to finish each level, index 0 is level 1
+        self.requirements = np.clip(np.floor(requirements), 1, self.MAX_REQUIREMENT).astype(np.int64)
+        #: total XP at which each level starts, index 0 is level 1
+        self.thresholds = np.concatenate(([0], np.cumsum(self.requirements)[:-1]))
+        self._thresholds = self.thresholds.tolist()
+
+    def lookup(self, total_xp: int) -> Tuple[int, int, int]:
+        """Returns ``(xp, xp_max, level)`` for a total amount of XP."""
+        index = bisect_right(self._thresholds, total_xp) - 1
+        return total_xp - self._thresholds[index], int(self.requirements[index]), index + 1
+
+    def lookup_many(self, total_xp: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Vectorized :meth:`lookup` over an array of totals."""
+        index = np.searchsorted(self.thresholds, total_xp, side="right") - 1
+        return total_xp - self.thresholds[index], self.requirements[index], index + 1
+
+    @classmethod
+    async def for_guild(cls, guild_id: int) -> LevelCurve:
+        """Returns a guild's curve, the default one if it never configured one."""
+        if (curve := cls._guilds.get(guild_id)) is not None:
+            cls._guilds.move_to_end(guild_id)
+            return curve
+
+        if config := await LevelingCurve.get_or_none(guild_id=guild_id):
+            curve = cls(config.base, config.increment, config.factor)
+        else:
+            curve = cls()
+        cls._guilds[guild_id] = curve
+        while len(cls._guilds) > cls.MAX_GUILDS:
+            cls._guilds.popitem(last=False)
+        return curve
+
+    @classmethod
+    async def configure(cls, guild_id: int, base: int, increment: int, factor: float) -> int:
+        """Changes a guild's curve and recomputes every member on it.
+
+        Returns:
+            int: The number of members recomputed.
+        """
+        await LevelingCurve.update_or_create(defaults={"base": base, "increment": increment, "factor": factor}, guild_id=guild_id)
+        cls._guilds.pop(guild_id, None)
+        return await cls.recompute(guild_id)
+
+    @classmethod
+    async def recompute(cls, guild_id: int) -> int:
+        """Rewrites the level, XP and XP needed of a guild's members from their total XP.
+
+        The levels are computed for the whole guild at once with NumPy and written
+        back with a single ``UPDATE ... FROM json_each(...)`` statement.
+
+        Returns:
+            int: The number of members recomputed.
+        """
+        curve = await cls.for_guild(guild_id)
+        # pending gains first, and none while the rows are rewritten
+        await Leveling.buffer.flush(guild_id)
+        async with Leveling.buffer.lock, in_transaction() as connection:
+            rows = np.array(await LevelingSystem.filter(guild_id=guild_id).values_list("id", "total_xp"), dtype=np.int64).reshape(-1, 2)
+            await curve.apply(connection, rows)
+        LeaderboardPages.invalidate(guild_id)
+        return len(rows)
+
+    async def apply(self, connection, rows: np.ndarray) -> None:
+        """Writes the level, XP and XP needed for ``(id, total_xp)`` rows in one statement."""
+        if not len(rows):
+            return
+        xp, xp_max, level = self.lookup_many(rows[:, 1])
+        payload = json.dumps(np.column_stack((rows[:, 0], level, xp, xp_max)).tolist())
+        await connection.execute_query(
+            'UPDATE "Leveling System" SET "level" = "new"."level", "xp" = "new"."xp", "xp_max" = "new"."xp_max" '
+            'FROM (SELECT json_extract("value", \'$[0]\') AS "id", json_extract("value", \'$[1]\') AS "level", '
+            'json_extract("value", \'$[2]\') AS "xp", json_extract("value", \'$[3]\') AS "xp_max" FROM json_each(?)) AS "new" '
+            'WHERE "Leveling System"."id" = "new"."id"',
+            [payload],
+        )
+
+
+class RankIndex:
+    """Sorted index over a guild's members for rank lookups.
+
+    Members are kept sorted by ``(-total_xp, user_id)``, so ties are broken by
+    total XP first and then deterministically by user ID. Rank lookups are an
+    O(log n) bisect and top-k slices don't scan every row of the guild.
+    Updates find their position with a bisect too but still shift the list,
+    which is O(n), just a memmove rather than a query per XP change.
+    Indexes are built lazily from the database and updated by :class:`XPBuffer`
+    flushes while they are loaded.
+    """
+    # the least recently used guild indexes are dropped beyond this
+    MAX_GUILDS = 256
+
+    _guilds: OrderedDict[int, RankIndex] = OrderedDict()
+    _building: Dict[int, Tuple[RankIndex, asyncio.Event]] = {}
+
+    def __init__(self) -> None:
+        self._keys: List[Tuple[int, int]] = []
+        self._totals: Dict[int, int] = {}
+        self._dirty: Optional[Set[int]] = None
+        self._stale = False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def update(self, user_id: int, total_xp: int) -> None:
+        """Inserts a member or moves them to their new total XP."""
+        if self._dirty is not None:
+            self._dirty.add(user_id)
+        if (old := self._totals.get(user_id)) is not None:
+            if old == total_xp:
+                return
+            del self._keys[bisect_left(self._keys, (-old, user_id))]
+        self._totals[user_id] = total_xp
+        insort(self._keys, (-total_xp, user_id))
+
+    def remove(self, user_id: int) -> None:
+        """Removes a member from the index, if they are in it."""
+        if self._dirty is not None:
+            self._dirty.add(user_id)
+        if (old := self._totals.pop(user_id, None)) is not None:
+            del self._keys[bisect_left(self._keys, (-old, user_id))]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Returns a member's 1-based rank, or ``None`` if they aren't ranked."""
+        if (total_xp := self._totals.get(user_id)) is None:
+            return None
+        return bisect_left(self._keys, (-total_xp, user_id)) + 1
+
+    def total_xp(self, user_id: int) -> Optional[int]:
+        """Returns a member's total XP as known to the index."""
+        return self._totals.get(user_id)
+
+    def top(self, limit: int, offset: int = 0) -> List[Tuple[int, int]]:
+        """Returns ``(user_id, total_xp)`` pairs for a slice of the ranking."""
+        return [(user_id, -key) for key, user_id in self._keys[offset:offset + limit]]
+
+    @classmethod
+    def get(cls, guild_id: int) -> Optional[RankIndex]:
+        """Returns a guild's index if it is loaded (or loading), without touching the database.
+
+        Meant for keeping the index up to date, use :meth:`for_guild` to read from it.
+        """
+        if (building := cls._building.get(guild_id)) is not None:
+            return building[0]
+        return cls._guilds.get(guild_id)
+
+    @classmethod
+    def invalidate(cls, guild_id: int) -> None:
+        """Drops a guild's index so it is rebuilt on the next lookup."""
+        cls._guilds.pop(guild_id, None)
+        if (building := cls._building.get(guild_id)) is not None:
+            # the rows being loaded may already be stale, so don't keep the result
+            building[0]._stale = True
+
+    @classmethod
+    async def for_guild(cls, guild_id: int) -> RankIndex:
+        """Returns a guild's index, building it from the database if needed."""
+        if (index := cls._guilds.get(guild_id)) is not None:
+            cls._guilds.move_to_end(guild_id)
+            return index
+        if (building := cls._building.get(guild_id)) is not None:
+            await building[1].wait()
+            return await cls.for_guild(guild_id)
+
+        index = cls()
+        # flushes that land while the rows are loading win over the rows
+        index._dirty = set()
+        cls._building[guild_id] = (index, asyncio.Event())
+        try:
+            rows = await LevelingSystem.filter(guild_id=guild_id).values_list("user_id", "total_xp")
+            dirty, index._dirty = index._dirty, None
+            for user_id, total_xp in rows:
+                if user_id not in dirty:
+                    index._totals[user_id] = total_xp
+                    index._keys.append((-total_xp, user_id))
+            index._keys.sort()
+        finally:
+            cls._building.pop(guild_id)[1].set()
+
+        if not index._stale:
+            cls._guilds[guild_id] = index
+            while len(cls._guilds) > cls.MAX_GUILDS:
+                cls._guilds.popitem(last=False)
+        return index
+
+
+class XPBuffer:
+    """Write-behind accumulator for XP gains.
+
+    Gains are coalesced per ``(guild_id, user_id)`` in memory and written in one
+    transaction by :meth:`flush`. Each chunk of members is one
+    ``INSERT ... ON CONFLICT DO UPDATE`` that applies the multiplier in SQL and
+    returns the new totals, whose levels are then written in one more
+    statement, so the database sees a few statements per flush instead of one
+    read-modify-write per message.
+    """
+    CHUNK_SIZE = 500
+
+    def __init__(self) -> None:
+        self._pending: Dict[Tuple[int, int], int] = {}
+        self._last_gain: Dict[Tuple[int, int], datetime] = {}
+        # also held by anything rewriting leveling rows in bulk, so a flush can't interleave with it
+        self.lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, guild_id: int, user_id: int, xp: int) -> None:
+        """Queues an XP gain, before the member's multiplier is applied."""
+        key = (guild_id, user_id)
+        self._pending[key] = self._pending.get(key, 0) + xp
+        self._last_gain[key] = datetime.now()
+
+    def discard(self, guild_id: int, user_id: int) -> None:
+        """Drops a member's queued gains, e.g. when they are deleted."""
+        self._pending.pop((guild_id, user_id), None)
+        self._last_gain.pop((guild_id, user_id), None)
+
+    async def flush(self, guild_id: Optional[int] = None) -> int:
+        """Writes queued gains to the database.
+
+        Args:
+            guild_id: Only write this guild's gains, e.g. before reading its ranks.
+
+        Returns:
+            int: The number of members that were written.
+        """
+        async with self.lock:
+            if guild_id is None:
+                pending, self._pending = self._pending, {}
+                last_gain, self._last_gain = self._last_gain, {}
+            else:
+                pending = {key: xp for key, xp in self._pending.items() if key[0] == guild_id}
+                last_gain = {key: self._last_gain.pop(key) for key in pending}
+                for key in pending:
+                    del self._pending[key]
+            if not pending:
+                return 0
+
+            try:
+                await self._write(pending, last_gain)
+            except Exception:
+                # requeue so a failed flush doesn't lose XP, newer gains are kept on top
+                for key, xp in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + xp
+                    self._last_gain.setdefault(key, last_gain[key])
+                raise
+            return len(pending)
+
+    async def _write(self, pending: Dict[Tuple[int, int], int], last_gain: Dict[Tuple[int, int], datetime]) -> None:
+        guilds: Dict[int, List[int]] = defaultdict(list)
+        for guild_id, user_id in pending:
+            guilds[guild_id].append(user_id)
+
+        # (guild_id, user_id, total_xp) for the rank indexes once committed
+        written: List[Tuple[int, int, int]] = []
+        cards: List[LevelingSystemCard] = []
+        ledger: List[XPLedger] = []
+
+        gains: Dict[int, int] = defaultdict(int)
+        created_at = str(datetime.now(timezone.utc))
+
+        async with in_transaction() as connection:
+            for guild_id, user_ids in guilds.items():
+                curve = await LevelCurve.for_guild(guild_id)
+                for i in range(0, len(user_ids), self.CHUNK_SIZE):
+                    chunk = user_ids[i:i + self.CHUNK_SIZE]
+                    payload = json.dumps([[user_id, pending[guild_id, user_id], str(last_gain[guild_id, user_id])] for user_id in chunk])
+                    # new members start at their raw gain with a multiplier of 1, the levels are written below
+                    _, rows = await connection.execute_query(
+                        'INSERT INTO "Leveling System" ("guild_id", "user_id", "xp", "xp_max", "level", "total_xp", "multiplier", "cooldown", "created_at") '
+                        'SELECT ?, json_extract("value", \'$[0]\'), 0, 0, 0, json_extract("value", \'$[1]\'), 1, json_extract("value", \'$[2]\'), ? '
+                        'FROM json_each(?) WHERE true '
+                        'ON CONFLICT ("guild_id", "user_id") DO UPDATE SET '
+                        '"total_xp" = "Leveling System"."total_xp" + "excluded"."total_xp" * "Leveling System"."multiplier", '
+                        '"cooldown" = "excluded"."cooldown" '
+                        'RETURNING "id", "user_id", "total_xp", "multiplier"',
+                        [guild_id, created_at, payload],
+                    )
+                    await curve.apply(connection, np.array([(row["id"], row["total_xp"]) for row in rows], dtype=np.int64).reshape(-1, 2))
+                    has_card = set(await LevelingSystemCard.filter(guild_id=guild_id, user_id__in=chunk).values_list("user_id", flat=True))
+
+                    for row in rows:
+                        user_id = row["user_id"]
+                        key = (guild_id, user_id)
+                        gained = pending[key] * row["multiplier"]
+                        ledger.append(XPLedger(guild_id=guild_id, user_id=user_id, timestamp=int(last_gain[key].timestamp()), xp=gained))
+                        gains[user_id] += gained
+                        written.append((guild_id, user_id, row["total_xp"]))
+
+                        if user_id not in has_card:
+                            cards.append(LevelingSystemCard(guild_id=guild_id, user_id=user_id, background_url=None, progress_bar_color="#11ebf2", font_color="#fff"))
+
+            if cards:
+                await LevelingSystemCard.bulk_create(cards, batch_size=self.CHUNK_SIZE)
+            if ledger:
+                await XPLedger.bulk_create(ledger, batch_size=self.CHUNK_SIZE)
+            await GlobalLeaderboard.add(gains, connection)
+
+        for guild_id, user_id, total_xp in written:
+            if (index := RankIndex.get(guild_id)) is not None:
+                index.update(user_id, total_xp)
+
+
 class Leveling:
+    # shared by every instance so messages still cooling down never reach the database
+    cooldowns = CooldownCache(cooldown=15)
+    buffer = XPBuffer()
+
     def __init__(self, guild_id: int, author_id: int) -> None:
         self.guild_id = guild_id
         self.author_id = author_id
@@ -88,51 +437,44 @@ class Leveling:
         
         
     async def add_xp(self, xp: int) -> Union[bool, str]:
-        if not (
-            user := await LevelingSystem.get_or_none(
-                guild_id=self.guild_id, user_id=self.author_id
-            )
-        ):
-            await self.create_user()
-            await RankCardSetting(guild_id=self.guild_id, user_id=self.author_id).create_card()
-            return True
-            
-        cooldown_time = datetime.strptime(str(user.cooldown), "%Y-%m-%d %H:%M:%S.%f")
-        time_difference = datetime.now() - cooldown_time
-
-        if time_difference.total_seconds() < 15:
+        key = (self.guild_id, self.author_id)
+        if self.cooldowns.remaining(key):
             return False
-        
-        accumulated_xp = (user.xp) + (xp * user.multiplier)
-        xp_max = user.xp_max
-        level = user.level
 
-        while accumulated_xp >= xp_max:
-            levels = int(accumulated_xp / user.xp_max)
-            accumulated_xp -= user.xp_max * levels
-            xp_max += 100 * levels
-            level += levels
-
-        await user.update_from_dict({"xp": accumulated_xp, "xp_max": xp_max, "level": level, "cooldown": str(datetime.now())}).save()
+        self.buffer.add(self.guild_id, self.author_id, xp)
+        self.cooldowns.touch(key)
         return True
         
     async def create_user(self) -> Union[bool, str]:
         if await LevelingSystem.get_or_none(guild_id=self.guild_id, user_id=self.author_id):
             return "User already exists"
-        await LevelingSystem.create(
-            guild_id=self.guild_id,
-            user_id=self.author_id,
-            xp=0,
-            xp_max=100,
-            level=1,
-            multiplier=1,
-            cooldown=datetime.now()
-        )
+        xp, xp_max, level = (await LevelCurve.for_guild(self.guild_id)).lookup(0)
+        try:
+            await LevelingSystem.create(
+                guild_id=self.guild_id,
+                user_id=self.author_id,
+                xp=xp,
+                xp_max=xp_max,
+                level=level,
+                total_xp=0,
+                multiplier=1,
+                cooldown=datetime.now()
+            )
+        except IntegrityError:
+            # a flush created the row in the meantime
+            return "User already exists"
+        if (index := RankIndex.get(self.guild_id)) is not None:
+            index.update(self.author_id, 0)
         return True
         
     async def delete_user(self) -> Union[bool, str]:
         if user := await LevelingSystem.get_or_none(guild_id=self.guild_id, user_id=self.author_id):
             await user.delete()
+            await GlobalLeaderboard.refresh([self.author_id])
+            self.cooldowns.discard((self.guild_id, self.author_id))
+            self.buffer.discard(self.guild_id, self.author_id)
+            if (index := RankIndex.get(self.guild_id)) is not None:
+                index.remove(self.author_id)
             return True
         else:
             return "User doesn't exists"
@@ -181,64 +523,541 @@ class Leveling:
 
         
     async def get_rank(self):
-        if await LevelingSystem.get_or_none(guild_id=self.guild_id):
-            users = await LevelingSystem.filter(guild_id=self.guild_id).order_by("-level")
-            return next((index + 1 for index, u in enumerate(users) if u.user_id == self.author_id), None)
-        else:
+        index = await RankIndex.for_guild(self.guild_id)
+        if not len(index):
             return "Guild doesn't exists"
+        return index.rank(self.author_id)
         
     async def leaderboard(self):
-        if users := await LevelingSystem.filter(guild_id=self.guild_id).order_by("-level").limit(10):
-            # return a dictionary like {"1": {"user_id": 123, "level": 1}, "2": {"user_id": 123, "level": 1}}
-            return {str(i+1): {"user_id": user.user_id, "level": user.level} for i, user in enumerate(users)}
-        else:
+        index = await RankIndex.for_guild(self.guild_id)
+        if not (top := index.top(10)):
             return "Guild doesn't exists"
-        
-class RankCard:
-    def __init__(self, guild_id: int, author_id: int):
+        levels = dict(await LevelingSystem.filter(guild_id=self.guild_id, user_id__in=[user_id for user_id, _ in top]).values_list("user_id", "level"))
+        # return a dictionary like {"1": {"user_id": 123, "level": 1, "total_xp": 0}, "2": {"user_id": 123, "level": 1, "total_xp": 0}}
+        return {str(i+1): {"user_id": user_id, "level": levels.get(user_id, 1), "total_xp": total_xp} for i, (user_id, total_xp) in enumerate(top)}
+
+
+class XPHistory:
+    """Time-bucketed XP history built from the append-only ``XP Ledger``.
+
+    Every flush appends one ledger row per member. :meth:`rollup` then folds the
+    raw rows into hourly and daily buckets in ``XP Rollup`` and deletes them, so
+    weekly leaderboards and history charts only ever read pre-aggregated rows.
+    """
+    HOUR = 3600
+    DAY = 86400
+    # hourly buckets older than this are dropped, the daily ones are kept
+    HOURLY_RETENTION = 14 * DAY
+
+    @classmethod
+    async def rollup(cls) -> int:
+        """Folds every raw ledger row into the hourly and daily buckets.
+
+        Returns:
+            int: The number of ledger rows rolled up.
+        """
+        async with in_transaction() as connection:
+            _, rows = await connection.execute_query('SELECT MAX("id") AS "last", COUNT(*) AS "count" FROM "XP Ledger"')
+            if rows[0]["last"] is None:
+                return 0
+            last, count = rows[0]["last"], rows[0]["count"]
+
+            for period in (cls.HOUR, cls.DAY):
+                await connection.execute_query(
+                    'INSERT INTO "XP Rollup" ("guild_id", "user_id", "period", "bucket", "xp") '
+                    'SELECT "guild_id", "user_id", ?, "timestamp" / ? * ?, SUM("xp") FROM "XP Ledger" WHERE "id" <= ? '
+                    'GROUP BY "guild_id", "user_id", "timestamp" / ? '
+                    'ON CONFLICT ("guild_id", "user_id", "period", "bucket") DO UPDATE SET "xp" = "xp" + excluded."xp"',
+                    [period, period, period, last, period],
+                )
+            await connection.execute_query('DELETE FROM "XP Ledger" WHERE "id" <= ?', [last])
+            await connection.execute_query(
+                'DELETE FROM "XP Rollup" WHERE "period" = ? AND "bucket" < ?',
+                [cls.HOUR, int(datetime.now().timestamp()) - cls.HOURLY_RETENTION],
+            )
+        return count
+
+    @classmethod
+    def since(cls, days: int) -> int:
+        """The first daily bucket of a window of ``days`` days ending today."""
+        return (int(datetime.now().timestamp()) // cls.DAY - days + 1) * cls.DAY
+
+    @classmethod
+    async def leaderboard(cls, guild_id: int, days: int = 7, limit: int = 10) -> List[Tuple[int, int]]:
+        """Returns ``(user_id, xp)`` for the members who gained the most XP in the last days."""
+        return await (
+            XPRollup.filter(guild_id=guild_id, period=cls.DAY, bucket__gte=cls.since(days))
+            .annotate(gained=Sum("xp"))
+            .group_by("user_id")
+            .order_by("-gained", "user_id")
+            .limit(limit)
+            .values_list("user_id", "gained")
+        )
+
+    @classmethod
+    async def daily(cls, guild_id: int, user_id: int, days: int = 30) -> List[int]:
+        """Returns a member's XP per day for the last days, oldest first."""
+        since = cls.since(days)
+        buckets = dict(
+            await XPRollup.filter(guild_id=guild_id, user_id=user_id, period=cls.DAY, bucket__gte=since).values_list("bucket", "xp")
+        )
+        return [buckets.get(since + day * cls.DAY, 0) for day in range(days)]
+
+
+def render_xp_history(name: str, daily: List[int]) -> bytes:
+    """Renders a member's daily XP as a bar chart, meant to run in a :class:`RenderPool` worker."""
+    # Figure instead of pyplot, so nothing global is shared between renders
+    fig = Figure(figsize=(10, 4))
+    fig.patch.set_facecolor('#ffffff')
+    ax = fig.subplots()
+    days = range(-len(daily) + 1, 1)
+    ax.bar(days, daily, color="#11ebf2", edgecolor="#0a9ea3")
+    ax.set_title(f"XP gained by {name}")
+    ax.set_xlabel("Days ago")
+    ax.set_ylabel("XP")
+    ax.set_xticks([day for day in days if day % 5 == 0])
+    ax.set_xticklabels([str(-day) for day in days if day % 5 == 0])
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.grid(axis='y', color='blue', linewidth=1, linestyle='-', alpha=0.2)
+
+    output = io.BytesIO()
+    fig.savefig(output, format="png", bbox_inches="tight")
+    return output.getvalue()
+
+
+class LevelingTransfer:
+    """Bulk import and export of a guild's leveling data.
+
+    Imports consume a stream of records in chunks, each written with one delete
+    and one ``bulk_create`` inside a transaction. Exports walk the guild by
+    primary key in chunks (a keyset cursor) straight into a compressed file, so
+    neither side holds the whole guild in memory.
+    """
+    # the IN lists bind a chunk plus the guild, SQLite allows 999 parameters
+    CHUNK_SIZE = 500
+    FIELDS = ("user_id", "total_xp", "level", "xp", "multiplier")
+
+    def __init__(self, guild_id: int) -> None:
         self.guild_id = guild_id
-        self.author_id = author_id
-        self.system = Leveling(self.guild_id, self.author_id)
-        self.session = aiohttp.ClientSession()
-        self.get_fonts
 
-    async def colors(self):
-        self.progress_bar_color = await RankCardSetting(self.guild_id, self.author_id).progress_bar_color()
-        self.font_color = await RankCardSetting(self.guild_id, self.author_id).font_color()
-              
-    async def get_avatar(self, bot) -> io.BytesIO:
-        async with self.session as session:
-            user = await bot.fetch_user(self.system.author_id)
-            avatar_url = user.avatar.url
-            async with session.get(str(avatar_url)) as resp:
-                return io.BytesIO(await resp.read())
+    @staticmethod
+    def total_xp(record: Dict[str, Any], curve: LevelCurve) -> int:
+        """Reads a record's total XP, or derives it from its ``level`` and ``xp``."""
+        if record.get("total_xp") not in (None, ""):
+            return max(int(record["total_xp"]), 0)
+        level = min(max(int(record.get("level") or 1), 1), curve.MAX_LEVEL)
+        return int(curve.thresholds[level - 1]) + max(int(record.get("xp") or 0), 0)
 
+    async def import_records(self, records: AsyncIterator[Dict[str, Any]], progress: Optional[Callable[[int], Awaitable[Any]]] = None) -> int:
+        """Replaces the guild's rows for every member in ``records``.
 
+        Args:
+            records: Records with a ``user_id`` and either ``total_xp`` or ``level``/``xp``.
+            progress: Awaited with the running total after every chunk.
 
-    async def background(self):
-        await self.colors()
-        self.background = await RankCardSetting(self.guild_id, self.author_id).get_background_image()
-            
-    async def avatar(self, bot):
-        self.avatar = Image.open(await self.get_avatar(bot)).resize((200, 200))
+        Returns:
+            int: The number of members imported.
+        """
+        curve = await LevelCurve.for_guild(self.guild_id)
+        await Leveling.buffer.flush(self.guild_id)
+        imported = 0
 
-    async def apply_mask(self) -> None:
+        try:
+            async for chunk in chunked(records, self.CHUNK_SIZE):
+                # the last record wins if a member is listed twice
+                members = {int(record["user_id"]): record for record in chunk}
+                rows, cards = [], []
+                async with Leveling.buffer.lock, in_transaction() as connection:
+                    has_card = set(await LevelingSystemCard.filter(guild_id=self.guild_id, user_id__in=list(members)).values_list("user_id", flat=True))
+                    await LevelingSystem.filter(guild_id=self.guild_id, user_id__in=list(members)).delete()
+                    for user_id, record in members.items():
+                        total_xp = self.total_xp(record, curve)
+                        xp, xp_max, level = curve.lookup(total_xp)
+                        rows.append(LevelingSystem(
+                            guild_id=self.guild_id, user_id=user_id, xp=xp, xp_max=xp_max, level=level,
+                            total_xp=total_xp, multiplier=int(record.get("multiplier") or 1), cooldown=str(datetime.now()),
+                        ))
+                        if user_id not in has_card:
+                            cards.append(LevelingSystemCard(guild_id=self.guild_id, user_id=user_id))
+                    await LevelingSystem.bulk_create(rows, batch_size=self.CHUNK_SIZE)
+                    if cards:
+                        await LevelingSystemCard.bulk_create(cards, batch_size=self.CHUNK_SIZE)
+                    await GlobalLeaderboard.refresh(list(members), connection)
 
-        bigsize = (int(self.avatar.size[0]) * 3, int(self.avatar.size[1]) * 3)
-        mask = Image.new('L', bigsize, 0)
+                imported += len(rows)
+                if progress:
+                    await progress(imported)
+        finally:
+            # chunks committed before a bad record stay imported
+            RankIndex.invalidate(self.guild_id)
+            LeaderboardPages.invalidate(self.guild_id)
+            LeaderboardPages.invalidate(None)
 
-        draw = ImageDraw.Draw(mask) 
-        draw.ellipse((0, 0) + bigsize, fill=255)
+        return imported
 
-        mask = mask.resize(self.avatar.size, Image.Resampling.LANCZOS)
-        self.avatar.putalpha(mask)
+    async def export(self, fmt: str = "jsonl") -> discord.File:
+        """Writes every member of the guild into a gzip compressed ``jsonl`` or ``csv`` file."""
+        await Leveling.buffer.flush(self.guild_id)
+        writer = RecordWriter(self.FIELDS, fmt)
+        last_id = 0
+        while rows := await (
+            LevelingSystem.filter(guild_id=self.guild_id, id__gt=last_id)
+            .order_by("id")
+            .limit(self.CHUNK_SIZE)
+            .values("id", *self.FIELDS)
+        ):
+            writer.write(rows)
+            last_id = rows[-1]["id"]
+        return writer.file(f"leveling_{self.guild_id}")
 
-        self.background.paste(self.avatar, (20, 20), mask=self.avatar)
 
-        self.draw = ImageDraw.Draw(self.background, 'RGB')
+class LevelingSeasons:
+    """Season resets, their archive and inactivity decay for a whole guild.
+
+    Everything here is a handful of set-based statements per chunk of rows
+    instead of one read-modify-write per member. Chunks are primary key ranges,
+    each committed in its own transaction, so SQLite's write lock is only held
+    for one chunk at a time while the XP buffer stays locked for the whole run.
+    """
+    CHUNK_SIZE = 1000
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id = guild_id
+
+    async def _ranges(self, query) -> List[Tuple[int, int]]:
+        ids = await query.order_by("id").values_list("id", flat=True)
+        return [(ids[i], ids[min(i + self.CHUNK_SIZE, len(ids)) - 1]) for i in range(0, len(ids), self.CHUNK_SIZE)]
+
+    async def _finish(self) -> None:
+        # the rank index, cached pages and global totals all derive from total_xp
+        await GlobalLeaderboard.refresh_guild(self.guild_id)
+        RankIndex.invalidate(self.guild_id)
+        LeaderboardPages.invalidate(self.guild_id)
+        LeaderboardPages.invalidate(None)
+
+    async def current(self) -> int:
+        """The number of the season in progress, 1 before the first reset."""
+        _, rows = await Tortoise.get_connection("default").execute_query(
+            'SELECT COALESCE(MAX("season"), 0) + 1 AS "season" FROM "Leveling Season" WHERE "guild_id" = ?', [self.guild_id]
+        )
+        return rows[0]["season"]
+
+    async def reset(self) -> Tuple[int, int, float]:
+        """Archives every member's standing into ``Leveling Season`` and starts them over.
+
+        Returns:
+            Tuple[int, int, float]: The archived season, the number of members and the seconds taken.
+        """
+        started = time.perf_counter()
+        curve = await LevelCurve.for_guild(self.guild_id)
+        xp, xp_max, level = curve.lookup(0)
+
+        await Leveling.buffer.flush(self.guild_id)
+        members = 0
+        async with Leveling.buffer.lock:
+            # read under the lock, two resets at once would archive into the same season otherwise
+            season = await self.current()
+            archived_at = int(datetime.now().timestamp())
+            for low, high in await self._ranges(LevelingSystem.filter(guild_id=self.guild_id)):
+                async with in_transaction() as connection:
+                    await connection.execute_query(
+                        'INSERT INTO "Leveling Season" ("guild_id", "season", "user_id", "level", "total_xp", "archived_at") '
+                        'SELECT "guild_id", ?, "user_id", "level", "total_xp", ? FROM "Leveling System" '
+                        'WHERE "guild_id" = ? AND "id" BETWEEN ? AND ?',
+                        [season, archived_at, self.guild_id, low, high],
+                    )
+                    count, _ = await connection.execute_query(
+                        'UPDATE "Leveling System" SET "total_xp" = 0, "xp" = ?, "xp_max" = ?, "level" = ? '
+                        'WHERE "guild_id" = ? AND "id" BETWEEN ? AND ?',
+                        [xp, xp_max, level, self.guild_id, low, high],
+                    )
+                members += count
+            await self._finish()
+        return season, members, time.perf_counter() - started
+
+    async def decay(self, percent: int, idle_days: int) -> Tuple[int, float]:
+        """Takes ``percent`` of the total XP of members that haven't gained any for ``idle_days``.
+
+        The ``cooldown`` column holds every member's last gain, so pending gains
+        are flushed first to keep members that just talked from decaying.
+
+        Returns:
+            Tuple[int, float]: The number of members decayed and the seconds taken.
+        """
+        started = time.perf_counter()
+        curve = await LevelCurve.for_guild(self.guild_id)
+        cutoff = str(datetime.now() - timedelta(days=idle_days))
+        idle = Q(cooldown__isnull=True) | Q(cooldown__lt=cutoff)
+
+        await Leveling.buffer.flush(self.guild_id)
+        members = 0
+        async with Leveling.buffer.lock:
+            for low, high in await self._ranges(LevelingSystem.filter(idle, guild_id=self.guild_id, total_xp__gt=0)):
+                async with in_transaction() as connection:
+                    _, rows = await connection.execute_query(
+                        'UPDATE "Leveling System" SET "total_xp" = "total_xp" * ? / 100 '
+                        'WHERE "guild_id" = ? AND "id" BETWEEN ? AND ? AND "total_xp" > 0 '
+                        'AND ("cooldown" IS NULL OR "cooldown" < ?) RETURNING "id", "total_xp"',
+                        [100 - percent, self.guild_id, low, high, cutoff],
+                    )
+                    # total_xp changed, so the levels are rederived from the curve
+                    await curve.apply(connection, np.array([(row["id"], row["total_xp"]) for row in rows], dtype=np.int64).reshape(-1, 2))
+                members += len(rows)
+            await self._finish()
+        return members, time.perf_counter() - started
+
+    async def schedule(self, season_days: int, decay_percent: int, idle_days: int) -> None:
+        """Sets up automatic resets every ``season_days`` and a daily decay, ``0`` turns either off."""
+        now = int(datetime.now().timestamp())
+        await LevelingSchedule.update_or_create(
+            defaults={
+                "season_days": season_days,
+                "next_season": now + season_days * XPHistory.DAY if season_days else None,
+                "decay_percent": decay_percent,
+                "decay_idle_days": idle_days,
+                "next_decay": now + XPHistory.DAY if decay_percent else None,
+            },
+            guild_id=self.guild_id,
+        )
+
+    async def archive(self, season: int, limit: int = 10) -> List[Dict[str, int]]:
+        """The top members of an archived season."""
+        return await (
+            LevelingSeason.filter(guild_id=self.guild_id, season=season)
+            .order_by("-total_xp", "user_id")
+            .limit(limit)
+            .values("user_id", "level", "total_xp")
+        )
+
+    @classmethod
+    async def run_due(cls) -> List[str]:
+        """Runs every scheduled reset and decay that is due.
+
+        Returns:
+            List[str]: A line per run with its timing.
+        """
+        now = int(datetime.now().timestamp())
+        reports = []
+        for schedule in await LevelingSchedule.filter(Q(next_season__lte=now) | Q(next_decay__lte=now)):
+            seasons = cls(schedule.guild_id)
+            if schedule.next_season is not None and schedule.next_season <= now:
+                season, members, elapsed = await seasons.reset()
+                schedule.next_season = now + schedule.season_days * XPHistory.DAY
+                reports.append(f"Guild {schedule.guild_id}: archived season {season} ({members} members) in {elapsed * 1000:.0f}ms")
+            if schedule.next_decay is not None and schedule.next_decay <= now:
+                members, elapsed = await seasons.decay(schedule.decay_percent, schedule.decay_idle_days)
+                schedule.next_decay = now + XPHistory.DAY
+                reports.append(f"Guild {schedule.guild_id}: decayed {members} members by {schedule.decay_percent}% in {elapsed * 1000:.0f}ms")
+            await schedule.save(update_fields=["next_season", "next_decay"])
+        return reports
+
+
+class GlobalLeaderboard:
+    """The cross-guild leaderboard materialized in ``Global Leveling``.
+
+    Every member's total XP summed over all guilds. XP flushes add their gains
+    to it incrementally, writers that replace rows :meth:`refresh` the members
+    they touched, and :meth:`rebuild` recomputes it from scratch in one pass.
+    """
+    # keeps every statement below SQLite's bound parameter limit
+    CHUNK_SIZE = 400
+
+    @classmethod
+    async def add(cls, gains: Dict[int, int], connection) -> None:
+        """Adds XP gains per user, meant to run inside the flush's transaction."""
+        items = list(gains.items())
+        for i in range(0, len(items), cls.CHUNK_SIZE):
+            chunk = items[i:i + cls.CHUNK_SIZE]
+            await connection.execute_query(
+                'INSERT INTO "Global Leveling" ("user_id", "total_xp") VALUES '
+                + ", ".join("(?, ?)" for _ in chunk)
+                + ' ON CONFLICT ("user_id") DO UPDATE SET "total_xp" = "total_xp" + excluded."total_xp"',
+                [value for pair in chunk for value in pair],
+            )
+
+    @classmethod
+    async def refresh(cls, user_ids: List[int], connection=None) -> None:
+        """Recomputes the global totals of some users from their guild rows."""
+        connection = connection or Tortoise.get_connection("default")
+        for i in range(0, len(user_ids), cls.CHUNK_SIZE):
+            chunk = user_ids[i:i + cls.CHUNK_SIZE]
+            marks = ", ".join("?" for _ in chunk)
+            await connection.execute_query(
+                f'INSERT INTO "Global Leveling" ("user_id", "total_xp") '
+                f'SELECT "user_id", SUM("total_xp") FROM "Leveling System" WHERE "user_id" IN ({marks}) GROUP BY "user_id" '
+                f'ON CONFLICT ("user_id") DO UPDATE SET "total_xp" = excluded."total_xp"',
+                chunk,
+            )
+            await connection.execute_query(
+                f'DELETE FROM "Global Leveling" WHERE "user_id" IN ({marks}) '
+                f'AND "user_id" NOT IN (SELECT "user_id" FROM "Leveling System" WHERE "user_id" IN ({marks}))',
+                chunk + chunk,
+            )
+
+    @classmethod
+    async def refresh_guild(cls, guild_id: int, connection=None) -> None:
+        """Recomputes the global totals of every member of a guild in one statement."""
+        connection = connection or Tortoise.get_connection("default")
+        await connection.execute_query(
+            'INSERT INTO "Global Leveling" ("user_id", "total_xp") '
+            'SELECT "user_id", SUM("total_xp") FROM "Leveling System" '
+            'WHERE "user_id" IN (SELECT "user_id" FROM "Leveling System" WHERE "guild_id" = ?) GROUP BY "user_id" '
+            'ON CONFLICT ("user_id") DO UPDATE SET "total_xp" = excluded."total_xp"',
+            [guild_id],
+        )
+
+    @classmethod
+    async def rebuild(cls) -> None:
+        """Recomputes the whole leaderboard with one aggregate over every guild."""
+        # no flush can add gains between the delete and the aggregate
+        async with Leveling.buffer.lock, in_transaction() as connection:
+            await connection.execute_query('DELETE FROM "Global Leveling"')
+            await connection.execute_query(
+                'INSERT INTO "Global Leveling" ("user_id", "total_xp") '
+                'SELECT "user_id", SUM("total_xp") FROM "Leveling System" GROUP BY "user_id"'
+            )
+        LeaderboardPages.invalidate(None)
+
+
+class LeaderboardPages:
+    """Keyset-paginated access to a guild's full leaderboard.
+
+    Pages are ordered by ``(total_xp DESC, user_id)`` like :class:`RankIndex` and
+    each one continues after the last row of the previous page, so page N costs
+    the same as page 1. Fetched pages are cached per guild for a short time.
+
+    Args:
+        guild_id: The guild whose leaderboard is paged.
+        per_page: The number of rows per page.
+    """
+    cache = TTLCache(ttl=30, max_size=1024)
+    FIELDS = ("user_id", "level", "total_xp")
+
+    def __init__(self, guild_id: Optional[int], per_page: int = 10) -> None:
+        self.guild_id = guild_id
+        self.per_page = per_page
+        # the cursor each known page starts after, page 0 starts at the top
+        self._cursors: List[Optional[Tuple[int, int]]] = [None]
+
+    def query(self):
+        return LevelingSystem.filter(guild_id=self.guild_id)
+
+    async def fetch(self, after: Optional[Tuple[int, int]]) -> List[Dict[str, int]]:
+        """Returns the rows following a ``(total_xp, user_id)`` cursor."""
+        key = (self.guild_id, self.per_page, after)
+        if (rows := self.cache.get(key)) is not None:
+            return rows
+
+        query = self.query()
+        if after is not None:
+            total_xp, user_id = after
+            query = query.filter(Q(total_xp__lt=total_xp) | Q(total_xp=total_xp, user_id__gt=user_id))
+        rows = await query.order_by("-total_xp", "user_id").limit(self.per_page).values(*self.FIELDS)
+        self.cache.put(key, rows)
+        return rows
+
+    async def page(self, number: int) -> List[Dict[str, int]]:
+        """Returns a page's rows, each with its ``rank``, or an empty list past the end.
+
+        Pages are reached one after another, so page ``number`` needs page ``number - 1``
+        to have been fetched first.
+        """
+        if number >= len(self._cursors):
+            return []
+        rows = await self.fetch(self._cursors[number])
+        if len(rows) == self.per_page and number + 1 == len(self._cursors):
+            self._cursors.append((rows[-1]["total_xp"], rows[-1]["user_id"]))
+        return [dict(row, rank=number * self.per_page + i + 1) for i, row in enumerate(rows)]
+
+    @classmethod
+    def invalidate(cls, guild_id: Optional[int]) -> None:
+        """Drops every cached page of a guild, ``None`` being the global leaderboard."""
+        cls.cache.invalidate(lambda key: key[0] == guild_id)
+
+
+class GlobalLeaderboardPages(LeaderboardPages):
+    """Keyset-paginated access to the materialized :class:`GlobalLeaderboard`."""
+    FIELDS = ("user_id", "total_xp")
+
+    def __init__(self, per_page: int = 10) -> None:
+        super().__init__(None, per_page)
+
+    def query(self):
+        return GlobalLeveling.all()
+
+
+@dataclass(frozen=True)
+class RankCardSnapshot:
+    """Everything a rank card is drawn from, loaded once per card."""
+    guild_id: int
+    user_id: int
+    display_name: str
+    avatar_url: str
+    avatar_hash: str
+    xp: int
+    xp_max: int
+    level: int
+    rank: Optional[int]
+    background_url: Optional[str]
+    progress_bar_color: str
+    font_color: str
+
+    @classmethod
+    async def load(cls, guild_id: int, user: Union[discord.Member, discord.User]) -> Optional[RankCardSnapshot]:
+        """Loads a member's leveling row, card settings and rank.
+
+        Args:
+            guild_id: The guild the card is for.
+            user: The already resolved member or user the card is for.
+
+        Returns:
+            Optional[RankCardSnapshot]: The snapshot, or ``None`` if the member has no leveling row.
+        """
+        if not (row := await LevelingSystem.get_or_none(guild_id=guild_id, user_id=user.id)):
+            return None
+        card = await LevelingSystemCard.get_or_none(guild_id=guild_id, user_id=user.id)
+        index = await RankIndex.for_guild(guild_id)
+
+        return cls(
+            guild_id=guild_id,
+            user_id=user.id,
+            display_name=user.display_name,
+            avatar_url=str(user.display_avatar.replace(format="png", size=256).url),
+            avatar_hash=user.display_avatar.key,
+            xp=row.xp,
+            xp_max=row.xp_max,
+            level=row.level,
+            rank=index.rank(user.id),
+            background_url=card.background_url if card else None,
+            progress_bar_color=card.progress_bar_color if card else "#11ebf2",
+            font_color=card.font_color if card else "#fff",
+        )
 
     @property
-    def get_fonts(self):
+    def cache_key(self) -> str:
+        """A hash of everything that affects how the card looks."""
+        parts = (self.xp, self.xp_max, self.level, self.rank, self.progress_bar_color, self.font_color, self.background_url, self.avatar_hash, self.display_name)
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class RankCardAssets:
+    """Fonts, images and static layers shared by every rank card drawn in a process.
+
+    Loaded once per process through :meth:`get` (worker processes preload it
+    when they start), so a render only draws the parts that change per card.
+    """
+    SIZE = (1000, 240)
+    AVATAR_SIZE = (200, 200)
+    # the progress bar's bounding box, its rounded ends stick out by half its height
+    BAR = (260, 160, 950, 200)
+    TRACK_COLOR = "#727175"
+    # how many label sprites (one per text and color) are kept around
+    MAX_LABELS = 128
+
+    _instance: Optional[RankCardAssets] = None
+
+    def __init__(self) -> None:
         self.big_font = ImageFont.FreeTypeFont('./bot/ext/fonts/ABeeZee-Regular.otf', 60)
         self.medium_font = ImageFont.FreeTypeFont('./bot/ext/fonts/ABeeZee-Regular.otf', 40)
         self.small_font = ImageFont.FreeTypeFont('./bot/ext/fonts/ABeeZee-Regular.otf', 30)
@@ -246,83 +1065,307 @@ class RankCard:
         self.smaller_font = ImageFont.FreeTypeFont('./bot/ext/fonts/ABeeZee-Regular.otf', 15)
         self.other_font =  ImageFont.FreeTypeFont('./bot/ext/fonts/SourceSansPro-Black.otf', 40)
 
-    async def level_text(self):
-        text_offset_x = self.bar_offset_x + 250
-        text_offset_y = 183.328125 - 65.5
-        self.draw1.text((text_offset_x, text_offset_y), f"Level: {await self.system.get_level()}", font=self.bigger_small_font, fill=self.font_color)
+        self.default_background = Image.open('./bot/ext/images/background.jpg').convert("RGB").resize(self.SIZE)
+
+        # drawn at 3x and downsampled so the circle's edge is anti-aliased
+        bigsize = (self.AVATAR_SIZE[0] * 3, self.AVATAR_SIZE[1] * 3)
+        mask = Image.new('L', bigsize, 0)
+        ImageDraw.Draw(mask).ellipse((0, 0) + bigsize, fill=255)
+        self.avatar_mask = mask.resize(self.AVATAR_SIZE, Image.Resampling.LANCZOS)
+
+        self.bar_track = self.bar_layer(self.BAR[2], self.TRACK_COLOR)
+        self._labels: OrderedDict[Tuple[str, str, float], Image.Image] = OrderedDict()
+        self._masks: Dict[Tuple[int, int], Image.Image] = {self.AVATAR_SIZE: self.avatar_mask}
+        self._backgrounds: Dict[Tuple[int, int], Image.Image] = {self.SIZE: self.default_background}
+
+    @classmethod
+    def get(cls) -> RankCardAssets:
+        """Returns this process's assets, loading them on first use."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def bar_layer(cls, end: int, color: str) -> Image.Image:
+        """Draws a rounded bar from the bar's start to ``end`` onto a transparent layer.
 
-    async def progress_bar(self):
-        self.draw1 = ImageDraw.Draw(self.background)
+        The layer is cropped to the bar's bounding box and meant to be pasted at
+        :meth:`bar_origin`.
+        """
+        x0, y0, _, y1 = cls.BAR
+        radius = (y1 - y0) // 2
+        layer = Image.new("RGBA", (end - x0 + 2 * radius + 1, y1 - y0 + 1), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        draw.rectangle((radius, 0, end - x0 + radius, y1 - y0), fill=color)
+        draw.ellipse((0, 0, 2 * radius, y1 - y0), fill=color)
+        draw.ellipse((end - x0, 0, end - x0 + 2 * radius, y1 - y0), fill=color)
+        return layer
 
-        self.bar_offset_x = int(self.avatar.size[0]) + 40 + 20
-        self.bar_offset_y = 160
-        self.bar_offset_x_1 = 1000 - 50
-        self.bar_offset_y_1 = 200
+    def background(self, size: Tuple[int, int]) -> Image.Image:
+        """Returns the default background resized for another card size."""
+        if (background := self._backgrounds.get(size)) is None:
+            background = Image.open('./bot/ext/images/background.jpg').convert("RGB").resize(size)
+            self._backgrounds[size] = background
+        return background
 
-        circle_size = self.bar_offset_y_1 - self.bar_offset_y
-        self.draw1.rectangle((self.bar_offset_x, self.bar_offset_y, self.bar_offset_x_1, self.bar_offset_y_1), fill="#727175")
-        self.draw1.ellipse((self.bar_offset_x - circle_size//2, self.bar_offset_y, self.bar_offset_x + circle_size//2, self.bar_offset_y + circle_size), fill="#727175")
-        self.draw1.ellipse((self.bar_offset_x_1 - circle_size//2, self.bar_offset_y, self.bar_offset_x_1 + circle_size//2, self.bar_offset_y_1), fill="#727175")
+    def circle_mask(self, size: Tuple[int, int]) -> Image.Image:
+        """Returns an anti-aliased circular mask for avatars of another size."""
+        if (mask := self._masks.get(size)) is None:
+            mask = self.avatar_mask.resize(size, Image.Resampling.LANCZOS)
+            self._masks[size] = mask
+        return mask
 
+    @classmethod
+    def bar_origin(cls) -> Tuple[int, int]:
+        x0, y0, _, y1 = cls.BAR
+        return x0 - (y1 - y0) // 2, y0
+
+    def label(self, text: str, color: str, x: float = 0.0) -> Image.Image:
+        """Returns a transparent sprite of a static label, e.g. ``Rank:``, in a color.
+
+        The sprite is meant to be pasted at ``int(x)``, the fractional part of
+        ``x`` (to a quarter pixel) is drawn into it so it lines up like drawn text.
+        """
+        offset = round((x % 1) * 4) / 4
+        key = (text, color, offset)
+        if (sprite := self._labels.get(key)) is not None:
+            self._labels.move_to_end(key)
+            return sprite
+
+        left, top, right, bottom = self.medium_font.getbbox(text)
+        sprite = Image.new("RGBA", (right + 2, bottom), (0, 0, 0, 0))
+        ImageDraw.Draw(sprite).text((offset, 0), text, font=self.medium_font, fill=color)
+        self._labels[key] = sprite
+        while len(self._labels) > self.MAX_LABELS:
+            self._labels.popitem(last=False)
+        return sprite
+
+
+class RankCardRenderer:
+    """Draws a rank card from a snapshot and the raw image bytes it needs.
+
+    Doesn't touch the network, the database or the event loop, so it can run
+    in a worker process. Everything static comes from :class:`RankCardAssets`.
+    """
+    def __init__(self, snapshot: RankCardSnapshot):
+        self.snapshot = snapshot
+        self.assets = RankCardAssets.get()
+
+    def background(self, background: Optional[bytes]):
+        if background:
+            self.background = Image.open(io.BytesIO(background)).convert("RGB").resize(self.assets.SIZE)
+        else:
+            self.background = self.assets.default_background.copy()
+            
+    def avatar(self, avatar: bytes):
+        self.avatar = Image.open(io.BytesIO(avatar)).convert("RGBA").resize(self.assets.AVATAR_SIZE)
+
+    def apply_mask(self) -> None:
+        self.avatar.putalpha(self.assets.avatar_mask)
+        self.background.paste(self.avatar, (20, 20), mask=self.avatar)
+        self.draw = ImageDraw.Draw(self.background, 'RGB')
+
+    def level_text(self):
+        text_offset_x = self.bar_offset_x + 250
+        text_offset_y = 183.328125 - 65.5
+        self.draw.text((text_offset_x, text_offset_y), f"Level: {self.snapshot.level}", font=self.assets.bigger_small_font, fill=self.snapshot.font_color)
+
+    def progress_bar(self):
+        self.bar_offset_x, self.bar_offset_y, self.bar_offset_x_1, _ = self.assets.BAR
+        origin = self.assets.bar_origin()
+        self.background.paste(self.assets.bar_track, origin, mask=self.assets.bar_track)
+
+        xp, xp_max = self.snapshot.xp, self.snapshot.xp_max
         bar_length = self.bar_offset_x_1 - self.bar_offset_x
-        progress = (int(await self.system.get_max_xp()) - int(await self.system.get_xp())) * 100/int(await self.system.get_max_xp())
+        progress = (xp_max - xp) * 100/xp_max
         progress = 100 - progress
         progress_bar_length = round(bar_length * progress / 100)
-        pbar_offset_x_1 = self.bar_offset_x + progress_bar_length
-        self.draw1.rectangle((self.bar_offset_x, self.bar_offset_y, pbar_offset_x_1, self.bar_offset_y_1), fill=self.progress_bar_color)
-        self.draw1.ellipse((self.bar_offset_x - circle_size//2, self.bar_offset_y, self.bar_offset_x + circle_size//2, self.bar_offset_y + circle_size), fill=self.progress_bar_color)
-        self.draw1.ellipse((pbar_offset_x_1 - circle_size//2, self.bar_offset_y, pbar_offset_x_1 + circle_size//2, self.bar_offset_y_1), fill=self.progress_bar_color)
-        percentage_text = f"{int(100 / int(await self.system.get_max_xp()) * int(await self.system.get_xp()))}%"
+        bar = self.assets.bar_layer(self.bar_offset_x + progress_bar_length, self.snapshot.progress_bar_color)
+        self.background.paste(bar, origin, mask=bar)
+
+        percentage_text = f"{int(100 / xp_max * xp)}%"
         text_offset_x = 245
         text_offset_y = 183.328125 - 65.5
-        self.draw1.text((text_offset_x, text_offset_y), percentage_text, font=self.bigger_small_font, fill=self.font_color)
+        self.draw.text((text_offset_x, text_offset_y), percentage_text, font=self.assets.bigger_small_font, fill=self.snapshot.font_color)
 
-    async def member_and_rank_text(self, member: discord.Member):
-        member_name_text = f"{member.display_name}"
-        rank = await self.system.get_rank()
+    def member_and_rank_text(self):
+        member_name_text = f"{self.snapshot.display_name}"
+        rank = self.snapshot.rank
+        font_color = self.snapshot.font_color
 
         # Calculate text size for member name text
-        text_size_name = self.draw1.textlength(member_name_text, font=self.medium_font)
+        text_size_name = self.draw.textlength(member_name_text, font=self.assets.medium_font)
 
         # Set initial offset for member name text
         text_offset_x_name = self.bar_offset_x - 20
         text_offset_y_name = self.bar_offset_y - int(text_size_name) - 50
 
         # Draw member name text
-        self.draw1.text((text_offset_x_name, text_offset_y_name), member_name_text, font=self.medium_font, fill=self.font_color)
+        self.draw.text((text_offset_x_name, text_offset_y_name), member_name_text, font=self.assets.medium_font, fill=font_color)
     
         # Set the offset_x for the rank text to be at the end of the member name text
         text_offset_x_label = text_offset_x_name + text_size_name + 440
         offset_y = self.bar_offset_y - int(text_size_name) - 60
 
-        self.draw.text((text_offset_x_label, offset_y+12), "Rank:", font=self.medium_font, fill=self.font_color)
-
-        # Set the common offset_y for both rank and member name text
+        label = self.assets.label("Rank:", font_color, text_offset_x_label)
+        self.background.paste(label, (int(text_offset_x_label), offset_y + 12), mask=label)
 
         # Draw the rank text
-        self.draw.text((text_offset_x_name + text_size_name + 550, offset_y), f"#{rank}", font=self.big_font, fill=self.font_color)
-
-
+        self.draw.text((text_offset_x_name + text_size_name + 550, offset_y), f"#{rank}", font=self.assets.big_font, fill=font_color)
 
-    async def xp_text(self):
-        xp_text = f"XP: {await self.system.get_xp()}/{await self.system.get_max_xp()}"
+    def xp_text(self):
+        xp_text = f"XP: {self.snapshot.xp}/{self.snapshot.xp_max}"
         text_offset_x = 750
         text_offset_y = 183.328125 - 65.5
-        self.draw1.text((text_offset_x, text_offset_y), xp_text, font=self.bigger_small_font, fill=self.font_color)
-        
-
+        self.draw.text((text_offset_x, text_offset_y), xp_text, font=self.assets.bigger_small_font, fill=self.snapshot.font_color)
 
-    async def generate(self, bot):
-        await self.background()
-        await self.avatar(bot)
-        await self.apply_mask()
-        await self.progress_bar()
-        await self.member_and_rank_text(await bot.fetch_user(self.author_id))
-        await self.xp_text()
-        await self.level_text()
+    def render(self, avatar: bytes, background: Optional[bytes] = None) -> bytes:
+        self.background(background)
+        self.avatar(avatar)
+        self.apply_mask()
+        self.progress_bar()
+        self.member_and_rank_text()
+        self.xp_text()
+        self.level_text()
         
         Imagebytes = io.BytesIO()
         self.background.save(Imagebytes, 'JPEG')
-        Imagebytes.seek(0)
-        return discord.File(fp=Imagebytes, filename=f"rank_card_{self.author_id}.jpg")
+        return Imagebytes.getvalue()
+
+
+def render_rank_card(snapshot: RankCardSnapshot, avatar: bytes, background: Optional[bytes] = None) -> bytes:
+    """Renders a rank card to JPEG bytes, meant to run in a :class:`RenderPool` worker."""
+    return RankCardRenderer(snapshot).render(avatar, background)
+
+
+class RankCard:
+    # rank cards are drawn in worker processes so a render never stalls the gateway
+    pool = RenderPool(timeout=15, initializer=RankCardAssets.get)
+    # repeated >rank calls with nothing changed are served without any Pillow work
+    cache = ByteLRUCache(max_bytes=32 * 1024 * 1024)
+
+    def __init__(self, guild_id: int, author_id: int):
+        self.guild_id = guild_id
+        self.author_id = author_id
+
+    @staticmethod
+    async def fetch(session: aiohttp.ClientSession, url: str) -> bytes:
+        async with session.get(url) as resp:
+            return await resp.read()
+
+    async def generate(self, bot, member: Optional[Union[discord.Member, discord.User]] = None):
+        if member is None:
+            member = bot.get_user(self.author_id) or await bot.fetch_user(self.author_id)
+        if not (snapshot := await RankCardSnapshot.load(self.guild_id, member)):
+            return None
+
+        if (image := self.cache.get(snapshot.cache_key)) is None:
+            async with aiohttp.ClientSession() as session:
+                avatar = await self.fetch(session, snapshot.avatar_url)
+                background = await self.fetch(session, snapshot.background_url) if snapshot.background_url else None
+
+            image = await self.pool.run(render_rank_card, snapshot, avatar, background)
+            self.cache.put(snapshot.cache_key, image)
+        return discord.File(fp=io.BytesIO(image), filename=f"rank_card_{self.author_id}.jpg")
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    """One row of a leaderboard card."""
+    rank: int
+    user_id: int
+    name: str
+    avatar_url: Optional[str]
+    level: int
+    total_xp: int
+
+
+def render_leaderboard_card(entries: List[LeaderboardEntry], avatars: List[Optional[bytes]]) -> bytes:
+    """Renders a leaderboard card to PNG bytes, meant to run in a :class:`RenderPool` worker."""
+    assets = RankCardAssets.get()
+    row_height = 80
+    width, height = assets.SIZE[0], 20 + row_height * len(entries)
+    avatar_size = (row_height - 16, row_height - 16)
+    mask = assets.circle_mask(avatar_size)
+
+    card = assets.background((width, height)).copy()
+    draw = ImageDraw.Draw(card, "RGBA")
+
+    for i, (entry, avatar) in enumerate(zip(entries, avatars)):
+        top = 10 + i * row_height
+        draw.rounded_rectangle((10, top + 4, width - 10, top + row_height - 4), radius=12, fill=(0, 0, 0, 110))
+
+        if avatar:
+            image = Image.open(io.BytesIO(avatar)).convert("RGBA").resize(avatar_size)
+            image.putalpha(mask)
+            card.paste(image, (24, top + 8), mask=image)
+
+        name = entry.name if len(entry.name) <= 24 else f"{entry.name[:23]}…"
+        draw.text((110, top + row_height // 2), f"#{entry.rank}", font=assets.medium_font, fill="#fff", anchor="lm")
+        draw.text((210, top + row_height // 2), name, font=assets.small_font, fill="#fff", anchor="lm")
+        draw.text((width - 30, top + row_height // 2), f"Level {entry.level}  •  {entry.total_xp} XP", font=assets.small_font, fill="#fff", anchor="rm")
+
+    output = io.BytesIO()
+    card.save(output, "PNG")
+    return output.getvalue()
+
+
+class LeaderboardCard:
+    """Builds a guild's leaderboard image.
+
+    Names and avatars are resolved concurrently, cached members first and REST
+    only for the rest, with a semaphore bounding the requests in flight, so the
+    whole card costs about one round trip instead of one per row.
+    """
+    # how many REST or CDN requests a card may have in flight at once
+    CONCURRENCY = 5
+
+    def __init__(self, guild: discord.Guild):
+        self.guild = guild
+        self.semaphore = asyncio.Semaphore(self.CONCURRENCY)
+
+    async def resolve(self, bot, user_id: int) -> Optional[Union[discord.Member, discord.User]]:
+        if user := self.guild.get_member(user_id) or bot.get_user(user_id):
+            return user
+        async with self.semaphore:
+            try:
+                return await bot.fetch_user(user_id)
+            except discord.HTTPException:
+                return None
+
+    async def fetch_avatar(self, session: aiohttp.ClientSession, url: Optional[str]) -> Optional[bytes]:
+        if not url:
+            return None
+        async with self.semaphore:
+            try:
+                async with session.get(url) as resp:
+                    return await resp.read() if resp.status == 200 else None
+            except aiohttp.ClientError:
+                return None
+
+    async def entries(self, bot) -> List[LeaderboardEntry]:
+        """Resolves the guild's top 10 into leaderboard rows."""
+        leaderboard = await Leveling(self.guild.id, 0).leaderboard()
+        if not isinstance(leaderboard, dict):
+            return []
+
+        rows = list(leaderboard.items())
+        users = await asyncio.gather(*(self.resolve(bot, row["user_id"]) for _, row in rows))
+        return [
+            LeaderboardEntry(
+                rank=int(rank),
+                user_id=row["user_id"],
+                name=user.display_name if user else str(row["user_id"]),
+                avatar_url=str(user.display_avatar.replace(format="png", size=128).url) if user else None,
+                level=row["level"],
+                total_xp=row["total_xp"],
+            )
+            for (rank, row), user in zip(rows, users)
+        ]
+
+    async def generate(self, entries: List[LeaderboardEntry]) -> discord.File:
+        async with aiohttp.ClientSession() as session:
+            avatars = await asyncio.gather(*(self.fetch_avatar(session, entry.avatar_url) for entry in entries))
 
+        image = await RankCard.pool.run(render_leaderboard_card, entries, list(avatars))
+        return discord.File(fp=io.BytesIO(image), filename=f"leaderboard_{self.guild.id}.png")
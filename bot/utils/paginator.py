@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import discord
+
+from typing import Awaitable, Callable, Optional
+
+
+__all__ = ("Paginator",)
+
+
+class Paginator(discord.ui.View):
+    """A button-driven view that fetches its pages on demand.
+
+    Pages are produced by ``fetch_page(number)`` (0-based), which returns an
+    embed or ``None`` once there are no more pages. Only the member who ran the
+    command can turn the pages.
+
+    Args:
+        author_id: The ID of the member allowed to use the buttons.
+        fetch_page: Coroutine function building the embed for a page number.
+        timeout: Seconds of inactivity before the buttons are disabled.
+    """
+
+    def __init__(self, author_id: int, fetch_page: Callable[[int], Awaitable[Optional[discord.Embed]]], *, timeout: float = 120.0) -> None:
+        super().__init__(timeout=timeout)
+        self.author_id = author_id
+        self.fetch_page = fetch_page
+        self.page = 0
+        self.message: Optional[discord.Message] = None
+
+    async def start(self, ctx, empty: str = "There is nothing to show") -> Optional[discord.Message]:
+        """Sends the first page, or ``empty`` if there is none."""
+        if not (embed := await self.fetch_page(0)):
+            return await ctx.send(empty)
+        self._update_buttons(has_next=await self.fetch_page(1) is not None)
+        self.message = await ctx.send(embed=embed, view=self)
+        return self.message
+
+    def _update_buttons(self, *, has_next: bool) -> None:
+        self._previous.disabled = self.page == 0
+        self._next.disabled = not has_next
+
+    async def _show(self, interaction: discord.Interaction, page: int) -> None:
+        if not (embed := await self.fetch_page(page)):
+            self._next.disabled = True
+            return await interaction.response.edit_message(view=self)
+        self.page = page
+        self._update_buttons(has_next=await self.fetch_page(page + 1) is not None)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("These buttons aren't for you", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self) -> None:
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def _previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, max(self.page - 1, 0))
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def _next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page + 1)
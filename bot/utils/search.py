@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import heapq
+
+from collections import defaultdict, deque
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+
+__all__ = ("trigrams", "TrigramIndex", "PrefixTrie", "AhoCorasick")
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Splits text into its lowercase trigrams, padded so short words and word starts count."""
+    text = f"  {text.lower()} "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class TrigramIndex:
+    """An inverted index from trigrams to names for ranked fuzzy search.
+
+    Names are scored against a query by the Jaccard similarity of their trigram
+    sets, and only names sharing at least one trigram with the query are ever
+    looked at. Names containing the query as a substring always rank first.
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._grams: Dict[str, FrozenSet[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._grams
+
+    def add(self, name: str) -> None:
+        """Indexes a name."""
+        if name in self._grams:
+            return
+        self._grams[name] = grams = trigrams(name)
+        for gram in grams:
+            self._postings[gram].add(name)
+
+    def remove(self, name: str) -> None:
+        """Removes a name, if it is indexed."""
+        for gram in self._grams.pop(name, ()):
+            postings = self._postings[gram]
+            postings.discard(name)
+            if not postings:
+                del self._postings[gram]
+
+    def rename(self, old: str, new: str) -> None:
+        """Replaces a name with another."""
+        self.remove(old)
+        self.add(new)
+
+    def search(self, query: str, limit: int = 10, threshold: float = 0.3) -> List[Tuple[str, float]]:
+        """Finds the names most similar to a query.
+
+        Args:
+            query: The text to search for.
+            limit: The maximum number of results.
+            threshold: The minimum similarity of names that don't contain the query.
+
+        Returns:
+            List[Tuple[str, float]]: ``(name, score)`` pairs, best first. Substring
+            matches score above 1.
+        """
+        grams = trigrams(query)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for name in self._postings.get(gram, ()):
+                shared[name] += 1
+
+        needle = query.lower()
+        if len(needle) < 3:
+            # too short to share a trigram with names that merely contain it
+            for name in self._grams:
+                if needle in name.lower():
+                    shared.setdefault(name, 0)
+
+        scores = []
+        for name, count in shared.items():
+            score = count / (len(grams) + len(self._grams[name]) - count)
+            if needle in name.lower():
+                score += 1
+            elif score < threshold:
+                continue
+            scores.append((score, name))
+        return [(name, score) for score, name in heapq.nlargest(limit, scores)]
+
+
+class _TrieNode:
+    __slots__ = ("children", "names", "top")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _TrieNode] = {}
+        # the names ending here with their uses, several can share a lowercase spelling
+        self.names: Dict[str, int] = {}
+        self.top: List[Tuple[int, str]] = []
+
+
+class PrefixTrie:
+    """A case-insensitive prefix trie that completes names by how much they're used.
+
+    Every node keeps the ``limit`` most used names below it, so a completion is
+    a walk down the prefix and nothing more. Raising a name's uses only touches
+    the nodes on its path, lowering or removing it rebuilds those nodes' lists
+    from their children.
+
+    Args:
+        limit: The most names a completion can return.
+    """
+
+    def __init__(self, limit: int = 25) -> None:
+        self.limit = limit
+        self._root = _TrieNode()
+        self._uses: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._uses)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._uses
+
+    @staticmethod
+    def _order(item: Tuple[int, str]) -> Tuple[int, str]:
+        # most uses first, then alphabetical
+        return -item[0], item[1]
+
+    def _path(self, name: str, create: bool = False) -> List[_TrieNode]:
+        path = [node := self._root]
+        for char in name.lower():
+            if (child := node.children.get(char)) is None:
+                if not create:
+                    return []
+                child = node.children[char] = _TrieNode()
+            path.append(node := child)
+        return path
+
+    def _rebuild(self, node: _TrieNode) -> None:
+        candidates = [(uses, name) for name, uses in node.names.items()]
+        for child in node.children.values():
+            candidates.extend(child.top)
+        node.top = heapq.nsmallest(self.limit, candidates, key=self._order)
+
+    def set(self, name: str, uses: int = 0) -> None:
+        """Adds a name or changes its uses."""
+        old = self._uses.get(name)
+        self._uses[name] = uses
+        path = self._path(name, create=True)
+        path[-1].names[name] = uses
+        if old is not None and uses < old:
+            for node in reversed(path):
+                self._rebuild(node)
+            return
+        for node in path:
+            top = [item for item in node.top if item[1] != name]
+            top.append((uses, name))
+            top.sort(key=self._order)
+            del top[self.limit:]
+            node.top = top
+
+    def use(self, name: str, uses: int = 1) -> None:
+        """Adds uses to a name, if it's in the trie."""
+        if name in self._uses:
+            self.set(name, self._uses[name] + uses)
+
+    def remove(self, name: str) -> None:
+        """Removes a name, if it's in the trie."""
+        if self._uses.pop(name, None) is None:
+            return
+        path = self._path(name)
+        del path[-1].names[name]
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if depth and not node.names and not node.children:
+                del path[depth - 1].children[name.lower()[depth - 1]]
+            else:
+                self._rebuild(node)
+
+    def rename(self, old: str, new: str) -> None:
+        """Replaces a name with another, keeping its uses."""
+        uses = self._uses.get(old, 0)
+        self.remove(old)
+        self.set(new, uses)
+
+    def complete(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        """Returns the most used names starting with ``prefix``, ignoring case."""
+        if not (path := self._path(prefix)):
+            return []
+        return [name for _, name in path[-1].top[:limit or self.limit]]
+
+
+class _AutomatonNode:
+    __slots__ = ("children", "fail", "pattern", "matches")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _AutomatonNode] = {}
+        self.fail: Optional[_AutomatonNode] = None
+        # the pattern ending here, and every pattern ending here through the failure links
+        self.pattern: Optional[str] = None
+        self.matches: Tuple[str, ...] = ()
+
+
+class AhoCorasick:
+    """A case-insensitive Aho-Corasick automaton that finds many phrases in one pass.
+
+    Patterns are added to and removed from the trie in place, only the failure
+    links are recomputed, once, by the first search after a change. Matches
+    have to start and end on word boundaries, so ``hi`` never fires in ``this``.
+    """
+
+    def __init__(self) -> None:
+        self._root = _AutomatonNode()
+        self._values: Dict[str, Any] = {}
+        self._linked = True
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, pattern: str) -> bool:
+        return pattern.lower() in self._values
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Iterates over the patterns and their values."""
+        return iter(list(self._values.items()))
+
+    def add(self, pattern: str, value: Any = None) -> None:
+        """Adds a pattern, or changes the value of one that's already added."""
+        pattern = pattern.lower()
+        if pattern in self._values:
+            self._values[pattern] = value
+            return
+        self._values[pattern] = value
+        node = self._root
+        for char in pattern:
+            node = node.children.setdefault(char, _AutomatonNode())
+        node.pattern = pattern
+        self._linked = False
+
+    def remove(self, pattern: str) -> None:
+        """Removes a pattern, if it's added."""
+        pattern = pattern.lower()
+        if pattern not in self._values:
+            return
+        del self._values[pattern]
+        path = [node := self._root]
+        for char in pattern:
+            path.append(node := node.children[char])
+        node.pattern = None
+        # prune the nodes no other pattern goes through
+        for depth in range(len(path) - 1, 0, -1):
+            if path[depth].pattern is not None or path[depth].children:
+                break
+            del path[depth - 1].children[pattern[depth - 1]]
+        self._linked = False
+
+    def _link(self) -> None:
+        # breadth first, so every node's failure target is linked before the node
+        self._root.fail = self._root
+        queue = deque()
+        for child in self._root.children.values():
+            child.fail = self._root
+            child.matches = (child.pattern,) if child.pattern is not None else ()
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in node.children.items():
+                fail = node.fail
+                while fail is not self._root and char not in fail.children:
+                    fail = fail.fail
+                child.fail = fail.children.get(char, self._root)
+                own = (child.pattern,) if child.pattern is not None else ()
+                child.matches = own + child.fail.matches
+                queue.append(child)
+        self._linked = True
+
+    def find(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """Finds every pattern in a text in one pass.
+
+        Args:
+            text: The text to search.
+
+        Yields:
+            Tuple[int, str, Any]: The start of each match with its pattern and
+            value, ordered by where the matches end.
+        """
+        if not self._values:
+            return
+        if not self._linked:
+            self._link()
+        text = text.lower()
+        root = node = self._root
+        for end, char in enumerate(text, 1):
+            while node is not root and char not in node.children:
+                node = node.fail
+            node = node.children.get(char, root)
+            for pattern in node.matches:
+                start = end - len(pattern)
+                # word characters at the edge of a pattern can't continue into the text
+                if pattern[0].isalnum() and start > 0 and text[start - 1].isalnum():
+                    continue
+                if pattern[-1].isalnum() and end < len(text) and text[end].isalnum():
+                    continue
+                yield start, pattern, self._values[pattern]
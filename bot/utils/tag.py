@@ -1,34 +1,735 @@
 from __future__ import annotations
 
-from ..db.database import TagModel
-from typing import Union
+import asyncio
+import discord
+import hashlib
+import json
+import time
+import zlib
+
+from ..db.database import TagAlias, TagModel, TagTrigger
+from .cache import CooldownCache, TTLCache
+from .search import AhoCorasick, PrefixTrie, TrigramIndex
+from .template import Template, compile_template
+from .transfer import RecordWriter, chunked
+from collections import OrderedDict, defaultdict
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple, Union
 from discord.utils import format_dt
 
+
+def named(name: str) -> Q:
+    """Filters tags by their name or any of their aliases, resolved in the same query."""
+    return Q(tag_name=name) | Q(tag_aliases__alias=name)
+
+
+class TagBlobs:
+    """Content-addressed, reference-counted tag contents in ``Tag Blobs``.
+
+    Identical contents share one blob keyed by their SHA-256, whichever guild or
+    tag they belong to, and a blob is deleted with its last reference. Contents
+    of ``COMPRESS_THRESHOLD`` bytes or more are stored zlib compressed whenever
+    that makes them smaller.
+    """
+    COMPRESS_THRESHOLD = 512
+
+    @classmethod
+    def encode(cls, content: str) -> Tuple[str, bytes, bool, int]:
+        """Returns the hash, stored bytes, whether they're compressed and the original size of a content."""
+        raw = content.encode()
+        digest = hashlib.sha256(raw).hexdigest()
+        if len(raw) >= cls.COMPRESS_THRESHOLD and len(packed := zlib.compress(raw, 9)) < len(raw):
+            return digest, packed, True, len(raw)
+        return digest, raw, False, len(raw)
+
+    @staticmethod
+    def decode(data: bytes, compressed: bool) -> str:
+        """Turns stored bytes back into the content."""
+        return (zlib.decompress(data) if compressed else data).decode()
+
+    @classmethod
+    async def acquire(cls, content: str, connection) -> int:
+        """Takes a reference to the blob of a content, creating it if it's new.
+
+        Returns:
+            int: The blob's id.
+        """
+        digest, data, compressed, size = cls.encode(content)
+        _, rows = await connection.execute_query(
+            'INSERT INTO "Tag Blobs" ("hash", "data", "compressed", "size", "refs") VALUES (?, ?, ?, ?, 1) '
+            'ON CONFLICT ("hash") DO UPDATE SET "refs" = "refs" + 1 RETURNING "id"',
+            [digest, data, compressed, size],
+        )
+        return rows[0]["id"]
+
+    @classmethod
+    async def acquire_many(cls, contents: List[str], connection) -> List[int]:
+        """Takes a reference per content in one batch, see :meth:`acquire`.
+
+        Returns:
+            List[int]: The blob id of every content, in order.
+        """
+        blobs: Dict[str, list] = {}
+        refs: Dict[str, int] = defaultdict(int)
+        digests = []
+        for content in contents:
+            digest, data, compressed, size = cls.encode(content)
+            blobs[digest] = [digest, data, compressed, size]
+            refs[digest] += 1
+            digests.append(digest)
+        await connection.execute_many(
+            'INSERT INTO "Tag Blobs" ("hash", "data", "compressed", "size", "refs") VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT ("hash") DO UPDATE SET "refs" = "refs" + excluded."refs"',
+            [blob + [refs[digest]] for digest, blob in blobs.items()],
+        )
+        _, rows = await connection.execute_query(
+            'SELECT "id", "hash" FROM "Tag Blobs" WHERE "hash" IN (SELECT "value" FROM json_each(?))', [json.dumps(list(blobs))]
+        )
+        ids = {row["hash"]: row["id"] for row in rows}
+        return [ids[digest] for digest in digests]
+
+    @staticmethod
+    async def release(blob_id: int, connection) -> None:
+        """Drops a reference to a blob, deleting it if it was the last one."""
+        await connection.execute_query('UPDATE "Tag Blobs" SET "refs" = "refs" - 1 WHERE "id" = ?', [blob_id])
+        await connection.execute_query('DELETE FROM "Tag Blobs" WHERE "id" = ? AND "refs" <= 0', [blob_id])
+
+
+class CachedTag(NamedTuple):
+    id: int
+    blob_id: int
+    data: bytes
+    compressed: bool
+    author_id: int
+    template: bool
+
+    @property
+    def content(self) -> str:
+        """The tag's content, only decompressed when it's asked for."""
+        return TagBlobs.decode(self.data, self.compressed)
+
+
+class TagCache:
+    """Per-guild tag lookups, loaded lazily and bounded by guild count and size.
+
+    A guild's tags are all loaded on its first lookup and dropped as a whole,
+    either when something changes them or when it is the least recently used
+    guild over either bound. Guilds larger than the whole cache are never
+    cached and fall back to a query per lookup, they are remembered until their
+    tags change so they aren't loaded again on every lookup.
+
+    Compiled templates are kept next to the tags, keyed by blob so tags with
+    the same content share one and an edit can never serve a stale one.
+
+    Args:
+        max_guilds: The maximum number of guilds cached at once.
+        max_bytes: The maximum combined size of every cached tag name and content.
+        max_templates: The maximum number of compiled templates cached at once.
+    """
+    # contents are cached as stored, compressed ones are only decompressed when compiled
+    FIELDS = ("id", "blob_id", "blob__data", "blob__compressed", "author_id", "template")
+
+    def __init__(self, max_guilds: int = 256, max_bytes: int = 16 * 1024 * 1024, max_templates: int = 4096) -> None:
+        self.max_guilds = max_guilds
+        self.max_bytes = max_bytes
+        self.max_templates = max_templates
+        self._templates: OrderedDict[int, Template] = OrderedDict()
+        self._guilds: OrderedDict[int, Dict[str, CachedTag]] = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._size = 0
+        # guilds whose tags didn't fit, looked up one tag at a time until they change
+        self._oversized: Set[int] = set()
+        # bumped on invalidation so a load that raced with a change isn't stored
+        self._generations: Dict[int, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    async def get(self, guild_id: int, name: str) -> Optional[CachedTag]:
+        """Returns a guild's tag by name, or ``None`` if it doesn't exist."""
+        if (tags := self._guilds.get(guild_id)) is not None:
+            self._guilds.move_to_end(guild_id)
+            self.hits += 1
+            return tags.get(name)
+
+        self.misses += 1
+        if guild_id not in self._oversized and (tags := await self._load(guild_id)) is not None:
+            return tags.get(name)
+        if tag := await TagModel.filter(named(name), guild_id=guild_id).first().values(*self.FIELDS):
+            return CachedTag(*tag.values())
+        return None
+
+    async def _load(self, guild_id: int) -> Optional[Dict[str, CachedTag]]:
+        generation = self._generations.get(guild_id, 0)
+        rows = await TagModel.filter(guild_id=guild_id).values_list("tag_name", *self.FIELDS)
+        aliases = await TagAlias.filter(guild_id=guild_id).values_list("alias", "tag_id")
+        size = sum(len(row[0].encode()) + len(row[3]) for row in rows)
+        size += sum(len(alias.encode()) for alias, _ in aliases)
+        if self._generations.get(guild_id, 0) != generation:
+            return None
+        if size > self.max_bytes:
+            self._oversized.add(guild_id)
+            return None
+
+        tags = {name: CachedTag(*fields) for name, *fields in rows}
+        by_id = {tag.id: tag for tag in tags.values()}
+        tags.update((alias, by_id[tag_id]) for alias, tag_id in aliases if tag_id in by_id)
+        self.invalidate(guild_id, bump=False)
+        self._guilds[guild_id] = tags
+        self._sizes[guild_id] = size
+        self._size += size
+        while len(self._guilds) > self.max_guilds or self._size > self.max_bytes:
+            evicted, _ = self._guilds.popitem(last=False)
+            self._size -= self._sizes.pop(evicted)
+        return tags
+
+    def template(self, tag: CachedTag) -> Template:
+        """Returns a tag's compiled template, compiling it on first use."""
+        if (template := self._templates.get(tag.blob_id)) is not None:
+            self._templates.move_to_end(tag.blob_id)
+            return template
+        template = self._templates[tag.blob_id] = compile_template(tag.content)
+        while len(self._templates) > self.max_templates:
+            self._templates.popitem(last=False)
+        return template
+
+    def discard_template(self, blob_id: int) -> None:
+        """Drops the compiled template of a blob that's no longer used."""
+        self._templates.pop(blob_id, None)
+
+    def invalidate(self, guild_id: int, *, bump: bool = True) -> None:
+        """Drops a guild's tags so the next lookup reloads them."""
+        if bump:
+            self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+            self._oversized.discard(guild_id)
+        if self._guilds.pop(guild_id, None) is not None:
+            self._size -= self._sizes.pop(guild_id)
+
+    def clear(self) -> None:
+        """Drops every cached guild and template."""
+        for guild_id in list(self._guilds):
+            self.invalidate(guild_id)
+        self._oversized.clear()
+        self._templates.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """The cache's hit and miss counters plus its current size."""
+        return {"hits": self.hits, "misses": self.misses, "guilds": len(self), "bytes": self._size, "templates": len(self._templates)}
+
+
+class TagNames:
+    """A guild's tag names and aliases, indexed for fuzzy search and completion."""
+
+    def __init__(self) -> None:
+        self.trigrams = TrigramIndex()
+        self.prefixes = PrefixTrie()
+        self.used_at = time.monotonic()
+
+    def add(self, name: str, uses: int = 0) -> None:
+        self.trigrams.add(name)
+        self.prefixes.set(name, uses)
+
+    def remove(self, name: str) -> None:
+        self.trigrams.remove(name)
+        self.prefixes.remove(name)
+
+    def rename(self, old: str, new: str) -> None:
+        self.trigrams.rename(old, new)
+        self.prefixes.rename(old, new)
+
+
+class TagNameIndex:
+    """Per-guild :class:`TagNames`, for fuzzy search and autocomplete.
+
+    A guild's names are loaded with their uses, never their contents, on first
+    use and then kept up to date by the tag operations. Guilds idle for
+    ``IDLE`` seconds are dropped by :meth:`evict_idle`, the least recently
+    used ones past ``MAX_GUILDS`` right away.
+    """
+    MAX_GUILDS = 1024
+    IDLE = 600
+
+    def __init__(self) -> None:
+        self._guilds: OrderedDict[int, TagNames] = OrderedDict()
+        # concurrent lookups of a guild that isn't loaded share one load
+        self._loading: Dict[int, asyncio.Future] = {}
+        # bumped by every change, so a load that raced with one isn't stored
+        self._generations: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    async def get(self, guild_id: int) -> TagNames:
+        """Returns a guild's names, loading them if they aren't loaded."""
+        if (names := self._guilds.get(guild_id)) is not None:
+            self._guilds.move_to_end(guild_id)
+            names.used_at = time.monotonic()
+            return names
+        if (loading := self._loading.get(guild_id)) is None:
+            loading = self._loading[guild_id] = asyncio.ensure_future(self._load(guild_id))
+            loading.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, guild_id: int) -> TagNames:
+        generation = self._generations.get(guild_id, 0)
+        names = TagNames()
+        for name, uses in await TagModel.filter(guild_id=guild_id).values_list("tag_name", "uses"):
+            names.add(name, uses)
+        for alias, uses in await TagAlias.filter(guild_id=guild_id).values_list("alias", "tag__uses"):
+            names.add(alias, uses)
+        if self._generations.get(guild_id, 0) == generation:
+            self._guilds[guild_id] = names
+            while len(self._guilds) > self.MAX_GUILDS:
+                self._guilds.popitem(last=False)
+        return names
+
+    def _changed(self, guild_id: int) -> Optional[TagNames]:
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        return self._guilds.get(guild_id)
+
+    def add(self, guild_id: int, name: str, uses: int = 0) -> None:
+        """Indexes a new tag name, if the guild is loaded."""
+        if (names := self._changed(guild_id)) is not None:
+            names.add(name, uses)
+
+    def remove(self, guild_id: int, name: str) -> None:
+        """Removes a tag name, if the guild is loaded."""
+        if (names := self._changed(guild_id)) is not None:
+            names.remove(name)
+
+    def rename(self, guild_id: int, old: str, new: str) -> None:
+        """Renames a tag, if the guild is loaded."""
+        if (names := self._changed(guild_id)) is not None:
+            names.rename(old, new)
+
+    def use(self, guild_id: int, name: str) -> None:
+        """Counts a use towards a name's completion order, if the guild is loaded."""
+        if (names := self._guilds.get(guild_id)) is not None:
+            names.prefixes.use(name)
+
+    def evict_idle(self) -> int:
+        """Drops every guild that wasn't looked up for ``IDLE`` seconds.
+
+        Returns:
+            int: The number of guilds dropped.
+        """
+        cutoff = time.monotonic() - self.IDLE
+        idle = [guild_id for guild_id, names in self._guilds.items() if names.used_at < cutoff]
+        for guild_id in idle:
+            del self._guilds[guild_id]
+        return len(idle)
+
+
+class TagTriggers:
+    """Per-guild :class:`AhoCorasick` automatons over auto-responder triggers.
+
+    Every message in a guild is matched against its automaton, so guilds are
+    loaded once, including the ones without triggers, and then changed in
+    place by the trigger operations. The least recently used guilds past
+    ``MAX_GUILDS`` are dropped. Each trigger maps to its tag's name.
+    """
+    MAX_GUILDS = 1024
+
+    def __init__(self) -> None:
+        self._guilds: OrderedDict[int, AhoCorasick] = OrderedDict()
+        # concurrent lookups of a guild that isn't loaded share one load
+        self._loading: Dict[int, asyncio.Future] = {}
+        # bumped by every change, so a load that raced with one isn't stored
+        self._generations: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    async def get(self, guild_id: int) -> AhoCorasick:
+        """Returns a guild's automaton, loading it if it isn't loaded."""
+        if (automaton := self._guilds.get(guild_id)) is not None:
+            self._guilds.move_to_end(guild_id)
+            return automaton
+        if (loading := self._loading.get(guild_id)) is None:
+            loading = self._loading[guild_id] = asyncio.ensure_future(self._load(guild_id))
+            loading.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, guild_id: int) -> AhoCorasick:
+        generation = self._generations.get(guild_id, 0)
+        automaton = AhoCorasick()
+        for trigger, name in await TagTrigger.filter(guild_id=guild_id).values_list("trigger", "tag__tag_name"):
+            automaton.add(trigger, name)
+        if self._generations.get(guild_id, 0) == generation:
+            self._guilds[guild_id] = automaton
+            while len(self._guilds) > self.MAX_GUILDS:
+                self._guilds.popitem(last=False)
+        return automaton
+
+    def _changed(self, guild_id: int) -> Optional[AhoCorasick]:
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        return self._guilds.get(guild_id)
+
+    def add(self, guild_id: int, trigger: str, name: str) -> None:
+        """Adds a trigger for a tag, if the guild is loaded."""
+        if (automaton := self._changed(guild_id)) is not None:
+            automaton.add(trigger, name)
+
+    def remove(self, guild_id: int, trigger: str) -> None:
+        """Removes a trigger, if the guild is loaded."""
+        if (automaton := self._changed(guild_id)) is not None:
+            automaton.remove(trigger)
+
+    def rename(self, guild_id: int, old: str, new: str) -> None:
+        """Points a renamed tag's triggers at its new name, if the guild is loaded."""
+        if (automaton := self._changed(guild_id)) is not None:
+            for trigger, name in automaton.items():
+                if name == old:
+                    automaton.add(trigger, new)
+
+
+class TagUsage:
+    """Counts tag uses in memory and writes them in batches.
+
+    :meth:`flush` adds every pending count with one atomic ``uses = uses + n``
+    statement per chunk of tags, instead of a read-modify-write per use.
+    """
+    # three bound parameters per tag, kept below SQLite's default limit of 999
+    CHUNK_SIZE = 300
+
+    def __init__(self) -> None:
+        self._pending: Dict[int, int] = {}
+        self.lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, tag_id: int, uses: int = 1) -> None:
+        """Counts a use of a tag."""
+        self._pending[tag_id] = self._pending.get(tag_id, 0) + uses
+
+    async def flush(self) -> int:
+        """Writes every pending count to the database.
+
+        Returns:
+            int: The number of tags that were updated.
+        """
+        async with self.lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            items = list(pending.items())
+            try:
+                async with in_transaction() as connection:
+                    for i in range(0, len(items), self.CHUNK_SIZE):
+                        chunk = items[i:i + self.CHUNK_SIZE]
+                        await connection.execute_query(
+                            'UPDATE "Tags" SET "uses" = "uses" + CASE "id" '
+                            + " ".join("WHEN ? THEN ?" for _ in chunk)
+                            + ' END WHERE "id" IN (' + ", ".join("?" for _ in chunk) + ")",
+                            [value for pair in chunk for value in pair] + [tag_id for tag_id, _ in chunk],
+                        )
+            except Exception:
+                # requeue so a failed flush doesn't lose uses
+                for tag_id, uses in pending.items():
+                    self.add(tag_id, uses)
+                raise
+            return len(pending)
+
+
+class TagSearch:
+    """Full-text search over tag contents with the ``Tags Search`` FTS5 table.
+
+    The table mirrors every tag's name and content under the tag's id and is
+    written alongside the tag itself, matching and BM25 ranking both run inside
+    SQLite. ``guild_id`` is an unindexed column that results are filtered on, so
+    the term statistics BM25 weighs words with are shared by every guild. That
+    only changes how results are ordered, never which tags match.
+    """
+
+    @staticmethod
+    def _connection(connection=None):
+        return connection or Tortoise.get_connection("default")
+
+    @classmethod
+    async def index(cls, tag_id: int, guild_id: int, name: str, content: str, connection=None) -> None:
+        """Adds a tag to the index, replacing what was indexed for it before."""
+        connection = cls._connection(connection)
+        await connection.execute_query('DELETE FROM "Tags Search" WHERE "rowid" = ?', [tag_id])
+        await connection.execute_query(
+            'INSERT INTO "Tags Search" ("rowid", "tag_name", "tag_content", "guild_id") VALUES (?, ?, ?, ?)',
+            [tag_id, name, content, guild_id],
+        )
+
+    @classmethod
+    async def rename(cls, tag_id: int, name: str, connection=None) -> None:
+        """Updates the name indexed for a tag."""
+        await cls._connection(connection).execute_query('UPDATE "Tags Search" SET "tag_name" = ? WHERE "rowid" = ?', [name, tag_id])
+
+    @classmethod
+    async def remove(cls, tag_id: int, connection=None) -> None:
+        """Removes a tag from the index."""
+        await cls._connection(connection).execute_query('DELETE FROM "Tags Search" WHERE "rowid" = ?', [tag_id])
+
+    @staticmethod
+    def match(query: str) -> str:
+        """Turns free text into an FTS5 query matching every word as a prefix."""
+        return " ".join('"' + word.replace('"', '""') + '"*' for word in query.split())
+
+    @classmethod
+    async def search(cls, guild_id: int, query: str, limit: int = 10) -> list:
+        """Finds a guild's tags whose name or content contain every word of ``query``.
+
+        Returns:
+            list: ``(tag_name, snippet)`` pairs, best BM25 score first.
+        """
+        if not (match := cls.match(query)):
+            return []
+        _, rows = await cls._connection().execute_query(
+            'SELECT "tag_name", snippet("Tags Search", 1, \'**\', \'**\', \'...\', 12) AS "snippet" '
+            'FROM "Tags Search" WHERE "Tags Search" MATCH ? AND "guild_id" = ? '
+            # names weigh twice as much as contents
+            'ORDER BY bm25("Tags Search", 2.0, 1.0) LIMIT ?',
+            [match, guild_id, limit],
+        )
+        return [(row["tag_name"], row["snippet"]) for row in rows]
+
+
+class TagPages:
+    """Keyset-paginated listing of a guild's tags, optionally only one member's.
+
+    Tags are ordered by name and each page continues after the last name of the
+    previous one, selecting only names and uses. Fetched pages are cached per
+    guild for a short time.
+
+    Args:
+        guild_id: The guild whose tags are listed.
+        author_id: Only list this member's tags.
+        per_page: The number of tags per page.
+    """
+    cache = TTLCache(ttl=30, max_size=1024)
+
+    def __init__(self, guild_id: int, author_id: Optional[int] = None, per_page: int = 15) -> None:
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.per_page = per_page
+        # the name each known page starts after, page 0 starts at the top
+        self._cursors: List[Optional[str]] = [None]
+
+    async def fetch(self, after: Optional[str]) -> List[Dict[str, Any]]:
+        """Returns the tags named after ``after``."""
+        key = (self.guild_id, self.author_id, self.per_page, after)
+        if (rows := self.cache.get(key)) is not None:
+            return rows
+
+        query = TagModel.filter(guild_id=self.guild_id)
+        if self.author_id is not None:
+            query = query.filter(author_id=self.author_id)
+        if after is not None:
+            query = query.filter(tag_name__gt=after)
+        rows = await query.order_by("tag_name").limit(self.per_page).values("tag_name", "uses")
+        self.cache.put(key, rows)
+        return rows
+
+    async def page(self, number: int) -> List[Dict[str, Any]]:
+        """Returns a page's tags, each with its ``position``, or an empty list past the end.
+
+        Pages are reached one after another, so page ``number`` needs page ``number - 1``
+        to have been fetched first.
+        """
+        if number >= len(self._cursors):
+            return []
+        rows = await self.fetch(self._cursors[number])
+        if len(rows) == self.per_page and number + 1 == len(self._cursors):
+            self._cursors.append(rows[-1]["tag_name"])
+        return [dict(row, position=number * self.per_page + i + 1) for i, row in enumerate(rows)]
+
+    @classmethod
+    def invalidate(cls, guild_id: int) -> None:
+        """Drops every cached page of a guild."""
+        cls.cache.invalidate(lambda key: key[0] == guild_id)
+
+
+class TagTransfer:
+    """Bulk import and export of a guild's tags as JSON Lines.
+
+    Imports consume a stream of records in chunks. Each chunk finds its name
+    conflicts with one query and is written with ``bulk_create`` inside a
+    transaction. Exports walk the guild by primary key straight into a
+    compressed file, so neither side holds every tag in memory.
+    """
+    CHUNK_SIZE = 500
+    FIELDS = ("tag_name", "content", "author_id", "uses", "template")
+
+    def __init__(self, guild_id: int, author_id: int) -> None:
+        self.guild_id = guild_id
+        self.author_id = author_id
+
+    async def _taken(self, names: List[str], connection) -> set:
+        marks = ", ".join("?" for _ in names)
+        # one query per table, a UNION would bind every name twice and pass SQLite's 999 parameters
+        _, tags = await connection.execute_query(
+            f'SELECT "tag_name" AS "name" FROM "Tags" WHERE "guild_id" = ? AND "tag_name" IN ({marks})', [self.guild_id, *names]
+        )
+        _, aliases = await connection.execute_query(
+            f'SELECT "alias" AS "name" FROM "Tag Aliases" WHERE "guild_id" = ? AND "alias" IN ({marks})', [self.guild_id, *names]
+        )
+        return {row["name"] for row in [*tags, *aliases]}
+
+    async def import_records(self, records: AsyncIterator[Dict[str, Any]], progress: Optional[Callable[[int, int], Awaitable[Any]]] = None) -> Tuple[int, int]:
+        """Creates a tag for every record whose name isn't taken yet.
+
+        Records without any content are skipped too.
+
+        Args:
+            records: Records with a ``tag_name`` and ``content``, optionally an ``author_id``, ``uses`` and ``template``.
+            progress: Awaited with the running totals after every chunk.
+
+        Returns:
+            Tuple[int, int]: The number of tags imported and skipped.
+        """
+        imported = skipped = 0
+        async for chunk in chunked(records, self.CHUNK_SIZE):
+            # the first record wins if a name is listed twice
+            tags: Dict[str, Dict[str, Any]] = {}
+            for record in chunk:
+                # a null content would otherwise become the text "None"
+                if record.get("content") is not None:
+                    tags.setdefault(str(record["tag_name"]), record)
+
+            async with in_transaction() as connection:
+                taken = await self._taken(list(tags), connection)
+                tags = {name: record for name, record in tags.items() if name not in taken}
+                if tags:
+                    contents = [str(record["content"]) for record in tags.values()]
+                    blob_ids = await TagBlobs.acquire_many(contents, connection)
+                    await TagModel.bulk_create([
+                        TagModel(
+                            guild_id=self.guild_id, tag_name=name, blob_id=blob_id,
+                            author_id=int(record.get("author_id") or self.author_id), uses=int(record.get("uses") or 0),
+                            template=bool(record.get("template")),
+                        )
+                        for (name, record), blob_id in zip(tags.items(), blob_ids)
+                    ], batch_size=self.CHUNK_SIZE, using_db=connection)
+                    ids = dict(await TagModel.filter(guild_id=self.guild_id, tag_name__in=list(tags)).using_db(connection).values_list("tag_name", "id"))
+                    await connection.execute_many(
+                        'INSERT INTO "Tags Search" ("rowid", "tag_name", "tag_content", "guild_id") VALUES (?, ?, ?, ?)',
+                        [[ids[name], name, content, self.guild_id] for name, content in zip(tags, contents)],
+                    )
+
+            # right after every commit, a later chunk can still stop the import
+            Tags.cache.invalidate(self.guild_id)
+            TagPages.invalidate(self.guild_id)
+            for name, record in tags.items():
+                Tags.names.add(self.guild_id, name, int(record.get("uses") or 0))
+            imported += len(tags)
+            skipped += len(chunk) - len(tags)
+            if progress:
+                await progress(imported, skipped)
+
+        return imported, skipped
+
+    async def export(self) -> discord.File:
+        """Writes every tag of the guild into a gzip compressed ``jsonl`` file."""
+        await Tags.usage.flush()
+        writer = RecordWriter(self.FIELDS)
+        last_id = 0
+        while rows := await (
+            TagModel.filter(guild_id=self.guild_id, id__gt=last_id)
+            .order_by("id")
+            .limit(self.CHUNK_SIZE)
+            .values("id", "tag_name", "author_id", "uses", "template", "blob__data", "blob__compressed")
+        ):
+            writer.write(dict(row, content=TagBlobs.decode(row["blob__data"], row["blob__compressed"])) for row in rows)
+            last_id = rows[-1]["id"]
+        return writer.file(f"tags_{self.guild_id}")
+
+
 class Tags:
     """
     A class representing a collection of tag-related operations.
 
     This class provides methods for retrieving, creating, deleting, editing, and managing tags.
     """
+    # shared by every instance, changes invalidate the guild and uses are written in batches
+    cache = TagCache()
+    names = TagNameIndex()
+    triggers = TagTriggers()
+    usage = TagUsage()
+    # keyed by (guild_id, trigger), so a busy channel can't make one trigger spam
+    trigger_cooldowns = CooldownCache(cooldown=30)
+
     def __init__(self, guild_id : int, author_id: int):
         self.guild_id = guild_id
         self.author_id = author_id
 
-    async def get(self, name: str):
-        """Retrieves the content of a tag by name.
+    def _invalidate(self) -> None:
+        self.cache.invalidate(self.guild_id)
+        TagPages.invalidate(self.guild_id)
+
+    async def _taken(self, name: str) -> bool:
+        return await TagModel.filter(named(name), guild_id=self.guild_id).exists()
+
+    async def get(self, name: str, variables: Optional[Dict[str, str]] = None):
+        """Retrieves the content of a tag by name or alias.
 
         Args:
-            name: The name of the tag to retrieve.
+            name: The name of the tag to retrieve, followed by its arguments when rendering.
+            variables: The variables to render template tags with, see :func:`template_variables`.
+                The raw content is returned without them.
 
         Returns:
             str: The content of the tag if it exists, otherwise error message.
 
         """
-        if tag := await TagModel.get_or_none(guild_id=self.guild_id, tag_name=name):
-            await tag.update_from_dict({"uses": tag.uses + 1}).save()
-            return tag.tag_content
-        else:
-            return "Tag Doesn't Exists"
+        tag_name, args = name, ""
+        tag = await self.cache.get(self.guild_id, name)
+        # names can contain spaces, so the whole name wins over splitting off arguments
+        if tag is None and variables is not None and " " in name.strip():
+            tag_name, args = name.strip().split(None, 1)
+            # only templates take arguments
+            if (tag := await self.cache.get(self.guild_id, tag_name)) and not tag.template:
+                tag = None
+        if tag:
+            self.usage.add(tag.id)
+            self.names.use(self.guild_id, tag_name)
+            if variables is None or not tag.template:
+                return tag.content
+            # a body whose blocks were all skipped would be an empty message
+            return self.cache.template(tag).render(variables, args) or "Tag has nothing to show"
+        if suggestions := await self.suggest(name):
+            return "Tag Doesn't Exists, did you mean " + ", ".join(f"`{suggestion}`" for suggestion in suggestions) + "?"
+        return "Tag Doesn't Exists"
+
+    async def complete(self, prefix: str, limit: int = 25) -> list:
+        """Completes a tag name for autocomplete, without touching the database once loaded.
+
+        Args:
+            prefix: What has been typed so far.
+            limit: The maximum number of names.
+
+        Returns:
+            list: The most used tag names and aliases starting with ``prefix``.
+
+        """
+        names = await self.names.get(self.guild_id)
+        return names.prefixes.complete(prefix, limit)
+
+    async def suggest(self, name: str, limit: int = 3) -> list:
+        """Finds the tag names closest to a name that doesn't exist.
+
+        Args:
+            name: The misspelled tag name.
+            limit: The maximum number of suggestions.
+
+        Returns:
+            list: The closest tag names, best first.
+
+        """
+        names = await self.names.get(self.guild_id)
+        return [match for match, _ in names.trigrams.search(name, limit)]
         
     async def get_owner_id(self, tag_name) -> Union[int, str]:
         """Retrieves the ID of the owner of a tag.
@@ -40,7 +741,7 @@ class Tags:
             Union[int, str]: The ID of the owner if the tag exists, otherwise an error message.
 
         """
-        if tag := await TagModel.get_or_none(tag_name=tag_name, guild_id=self.guild_id):
+        if tag := await self.cache.get(self.guild_id, tag_name):
             return tag.author_id
         else:
             return "Tag doesn't exists"
@@ -57,9 +758,14 @@ class Tags:
             str: A message indicating the status of the tag creation.
 
         """
-        if await TagModel.exists(guild_id=self.guild_id, tag_name=name):
+        if await self._taken(name):
             return "Tag already exists"
-        await TagModel.create(guild_id=self.guild_id, tag_name=name, tag_content=content, author_id=self.author_id)
+        async with in_transaction() as connection:
+            blob_id = await TagBlobs.acquire(content, connection)
+            tag = await TagModel.create(guild_id=self.guild_id, tag_name=name, blob_id=blob_id, author_id=self.author_id, using_db=connection)
+            await TagSearch.index(tag.id, self.guild_id, name, content, connection)
+        self._invalidate()
+        self.names.add(self.guild_id, name)
         return "Tag created"
 
 
@@ -81,31 +787,68 @@ class Tags:
             return "Tag doesn't exists"
         if tag.author_id != self.author_id:
             return "You don't own this tag"
-        if tag.aliases:
-            await self.delete_alias(tag.tag_name, tag.aliases)
-        await tag.delete()
+        aliases = await TagAlias.filter(tag_id=tag.id).values_list("alias", flat=True)
+        triggers = await TagTrigger.filter(tag_id=tag.id).values_list("trigger", flat=True)
+        async with in_transaction() as connection:
+            await TagAlias.filter(tag_id=tag.id).using_db(connection).delete()
+            await TagTrigger.filter(tag_id=tag.id).using_db(connection).delete()
+            await tag.delete(using_db=connection)
+            await TagBlobs.release(tag.blob_id, connection)
+            await TagSearch.remove(tag.id, connection)
+        self._invalidate()
+        self.cache.discard_template(tag.blob_id)
+        for alias in [tag.tag_name, *aliases]:
+            self.names.remove(self.guild_id, alias)
+        for trigger in triggers:
+            self.triggers.remove(self.guild_id, trigger)
         return "Tag deleted successfully"
 
     async def edit(self, name: str, content: str) -> str:
         """Edits the content of a tag with the specified name.
 
         Args:
-            name: The name of the tag to edit.
+            name: The name or an alias of the tag to edit.
             content: The new content of the tag.
 
         Returns:
             str: A message indicating the status of the tag editing.
 
         """
-        if tag := await TagModel.get_or_none(tag_name=name, guild_id=self.guild_id):
+        if tag := await TagModel.filter(named(name), guild_id=self.guild_id).first():
             if tag.author_id == self.author_id:
-                await tag.update_from_dict({"tag_content": content}).save()
+                async with in_transaction() as connection:
+                    old_blob_id = tag.blob_id
+                    tag.blob_id = await TagBlobs.acquire(content, connection)
+                    await tag.save(update_fields=["blob_id"], using_db=connection)
+                    await TagBlobs.release(old_blob_id, connection)
+                    await TagSearch.index(tag.id, self.guild_id, tag.tag_name, content, connection)
+                self._invalidate()
+                self.cache.discard_template(old_blob_id)
                 return "Tag edited"
             else:
                 return "You don't own this tag"
         else:
             return "Tag doesn't exist"
 
+    async def set_template(self, name: str, enabled: bool) -> str:
+        """Turns rendering a tag's variables and blocks on or off.
+
+        Args:
+            name: The name or an alias of the tag.
+            enabled: Whether the tag is a template.
+
+        Returns:
+            str: A message indicating the status of the change.
+
+        """
+        if not (tag := await TagModel.filter(named(name), guild_id=self.guild_id).first()):
+            return "Tag doesn't exist"
+        if tag.author_id != self.author_id:
+            return "You don't own this tag"
+        await tag.update_from_dict({"template": enabled}).save(update_fields=["template"])
+        self._invalidate()
+        return f"`{tag.tag_name}` is {'now' if enabled else 'no longer'} a template"
+
     async def add_alias(self, tag_name: str, alias: str) -> str:
         """Adds an alias to a tag.
 
@@ -125,10 +868,15 @@ class Tags:
             return "Tag doesn't exist"
         if tag.author_id != self.author_id:
             return "You don't own this tag"
-        if await TagModel.exists(guild_id=self.guild_id, tag_name=alias):
+        if await self._taken(alias):
             return "Can't add alias, name already exists"
-        await TagModel.create(guild_id=self.guild_id, tag_name=alias, tag_content=tag.tag_content, author_id=self.author_id)
-        await tag.update_from_dict({'aliases': alias}).save()
+        try:
+            await TagAlias.create(guild_id=self.guild_id, alias=alias, tag=tag)
+        except IntegrityError:
+            # taken by another alias in the meantime
+            return "Can't add alias, name already exists"
+        self._invalidate()
+        self.names.add(self.guild_id, alias, tag.uses)
         return f"Added alias to `{tag_name}`, `{alias}`"
 
     async def delete_alias(self, tag_name: str, alias: str) -> str:
@@ -144,9 +892,9 @@ class Tags:
         """
         if tag := await TagModel.get_or_none(tag_name=tag_name, guild_id=self.guild_id):
             if tag.author_id == self.author_id:
-                if tag_aliased := await TagModel.get_or_none(tag_name=alias, guild_id=self.guild_id):
-                    await tag_aliased.delete()
-                    await tag.update_from_dict({'aliases': None}).save()
+                if await TagAlias.filter(guild_id=self.guild_id, alias=alias, tag_id=tag.id).delete():
+                    self._invalidate()
+                    self.names.remove(self.guild_id, alias)
                     return f"Deleted alias from `{tag_name}`"
                 else:
                     return "Alias doesn't exist"
@@ -155,6 +903,82 @@ class Tags:
         else:
             return "Tag doesn't exist"
 
+    async def add_trigger(self, tag_name: str, trigger: str) -> str:
+        """Makes a tag respond whenever a message contains a phrase.
+
+        Args:
+            tag_name: The name or an alias of the tag to respond with.
+            trigger: The phrase, matched as whole words and ignoring case.
+
+        Returns:
+            str: A message indicating the status of the trigger addition.
+
+        """
+        if not (trigger := trigger.strip().lower()):
+            return "Trigger can't be empty"
+        if not (tag := await TagModel.filter(named(tag_name), guild_id=self.guild_id).first()):
+            return "Tag doesn't exist"
+        try:
+            await TagTrigger.create(guild_id=self.guild_id, trigger=trigger, tag=tag)
+        except IntegrityError:
+            return "Trigger already exists"
+        self.triggers.add(self.guild_id, trigger, tag.tag_name)
+        return f"`{tag.tag_name}` now responds to `{trigger}`"
+
+    async def delete_trigger(self, trigger: str) -> str:
+        """Deletes an auto-responder trigger.
+
+        Args:
+            trigger: The phrase to stop responding to.
+
+        Returns:
+            str: A message indicating the status of the trigger deletion.
+
+        """
+        trigger = trigger.strip().lower()
+        if await TagTrigger.filter(guild_id=self.guild_id, trigger=trigger).delete():
+            self.triggers.remove(self.guild_id, trigger)
+            return "Trigger deleted"
+        return "Trigger doesn't exist"
+
+    async def list_triggers(self) -> list:
+        """Lists the guild's auto-responder triggers.
+
+        Returns:
+            list: ``(trigger, tag_name)`` pairs, ordered by trigger.
+
+        """
+        return await TagTrigger.filter(guild_id=self.guild_id).order_by("trigger").values_list("trigger", "tag__tag_name")
+
+    async def respond(self, content: str, variables: Dict[str, str]) -> Optional[str]:
+        """Finds the auto-responder a message triggers.
+
+        The message is matched against every trigger in one pass, and the
+        first trigger that isn't on cooldown responds. Template tags are
+        rendered with the whole message as ``{args}``.
+
+        Args:
+            content: The message's content.
+            variables: The variables to render the tag with, see :func:`template_variables`.
+
+        Returns:
+            Optional[str]: The response, or ``None`` if nothing was triggered.
+
+        """
+        automaton = await self.triggers.get(self.guild_id)
+        for _, trigger, name in automaton.find(content):
+            if self.trigger_cooldowns.remaining((self.guild_id, trigger)):
+                continue
+            if not (tag := await self.cache.get(self.guild_id, name)):
+                continue
+            self.trigger_cooldowns.touch((self.guild_id, trigger))
+            self.usage.add(tag.id)
+            self.names.use(self.guild_id, name)
+            if not tag.template:
+                return tag.content
+            return self.cache.template(tag).render(variables, content) or None
+        return None
+
     async def rename(self, tag_name: str, new_name: str) -> str:
         """Renames a tag.
 
@@ -168,9 +992,14 @@ class Tags:
         """
         if tag := await TagModel.get_or_none(tag_name=tag_name, guild_id=self.guild_id):
             if tag.author_id == self.author_id:
-                if await TagModel.exists(guild_id=self.guild_id, tag_name=new_name):
+                if await self._taken(new_name):
                     return "Name already exists"
-                await tag.update_from_dict({"tag_name": new_name}).save()
+                async with in_transaction() as connection:
+                    await tag.update_from_dict({"tag_name": new_name}).save(update_fields=["tag_name"], using_db=connection)
+                    await TagSearch.rename(tag.id, new_name, connection)
+                self._invalidate()
+                self.names.rename(self.guild_id, tag_name, new_name)
+                self.triggers.rename(self.guild_id, tag_name, new_name)
                 return "Renamed tag"
             else:
                 return "You don't own this tag"
@@ -187,75 +1016,112 @@ class Tags:
             Union[dict, str]: A dictionary containing the tag information if the tag exists, otherwise an error message.
 
         """
-        # get all information on the tag with {name}
-        if tag := await TagModel.get_or_none(tag_name=name, guild_id=self.guild_id):
-            tags = await TagModel.filter(guild_id=self.guild_id).order_by('-uses')
+        # get all information on the tag with {name}, pending uses first so the counts are current
+        await self.usage.flush()
+        if tag := await TagModel.filter(named(name), guild_id=self.guild_id).first():
+            aliases = await TagAlias.filter(tag_id=tag.id).order_by("alias").values_list("alias", flat=True)
 
             return [
                 tag.tag_name,
                 tag.author_id,
                 tag.uses,
                 format_dt(tag.created_at),
-                tag.aliases,
-                next((index + 1 for index, t in enumerate(tags) if t.tag_name == tag.tag_name), None)
+                ", ".join(aliases) or None,
+                await self.rank(tag.tag_name, tag.uses)
             ]
         else:
             return "Tag doesn't exists"
 
-    async def list(self) -> Union[list, str]:
+    async def rank(self, name: str, uses: int) -> int:
+        """Computes a tag's popularity rank from the ``(guild_id, uses DESC, tag_name)`` index.
+
+        Tags are ranked by uses, ties by name, so the rank is one more than the
+        number of tags ahead of it, counted without fetching any of them.
+
+        Args:
+            name: The name of the tag.
+            uses: The tag's uses.
+
+        Returns:
+            int: The tag's rank, 1 being the most used.
+
+        """
+        ahead = Q(uses__gt=uses) | Q(uses=uses, tag_name__lt=name)
+        return await TagModel.filter(ahead, guild_id=self.guild_id).count() + 1
+
+    async def top(self, limit: int = 10) -> list:
+        """Retrieves the guild's most used tags.
+
+        Args:
+            limit: The number of tags.
+
+        Returns:
+            list: ``(tag_name, uses)`` pairs, most used first.
+
+        """
+        await self.usage.flush()
+        return await TagModel.filter(guild_id=self.guild_id).order_by("-uses", "tag_name").limit(limit).values_list("tag_name", "uses")
+
+    def list(self) -> TagPages:
         """Lists all tags in the guild.
 
         Returns:
-            Union[list, str]: A list of dictionaries representing the tags if there are any, otherwise an error message.
+            TagPages: The guild's tags, fetched a page at a time.
 
         """
-        # list all tags in the guild
-        if tags := await TagModel.filter(guild_id=self.guild_id):
-            return "\n".join(
-                f"{i+1}. `{name}`"
-                for i, name in enumerate(
-                    tag.tag_name for tag in tags
-                )
-            )
-        if not tags:
-            return "Server doesn't have any tags"
+        return TagPages(self.guild_id)
 
     async def query(self, query: str) -> Union[list, str]:
-        """Queries for tags based on a search query.
+        """Queries for tags whose names are similar to a search query, best matches first.
 
         Args:
-            query: The search query.
+            query: The search query, typos are tolerated.
 
         Returns:
             Union[list, str]: A list of dictionaries representing the matching tags if there are any, otherwise an error message.
 
         """
-        if tags := await TagModel.filter(guild_id=self.guild_id):
-            return "\n".join(
-                f"{i+1}. `{name}`"
-                for i, name in enumerate(
-                    tag.tag_name for tag in tags if query in tag.tag_name
-                )
-            )
-        else:
+        if not len(index := (await self.names.get(self.guild_id)).trigrams):
             return "This server doesn't have any tags"
+        if matches := index.search(query):
+            return "\n".join(f"{i+1}. `{name}`" for i, (name, _) in enumerate(matches))
+        else:
+            return "No tags found"
+
+    async def grep(self, query: str) -> str:
+        """Searches the contents of the guild's tags.
 
-    async def author(self) -> Union[list, str]:
+        Args:
+            query: The words to look for, each also matches as a prefix.
+
+        Returns:
+            str: The matching tags with a snippet of each, best matches first, otherwise an error message.
+
+        """
+        if not (results := await TagSearch.search(self.guild_id, query)):
+            return "No tags found"
+        lines = []
+        # a message holds 2000 characters, room is left for the "and N more" line
+        size = 0
+        for i, (name, snippet) in enumerate(results):
+            line = f"{i+1}. `{name}`: {' '.join(snippet.split())}"
+            if len(line) > 300:
+                line = line[:297] + "..."
+            if size + len(line) + 1 > 1950:
+                lines.append(f"and {len(results) - i} more")
+                break
+            lines.append(line)
+            size += len(line) + 1
+        return "\n".join(lines)
+
+    def author(self) -> TagPages:
         """Retrieves all tags owned by the author.
 
         Returns:
-            Union[list, str]: A list of dictionaries representing the tags if there are any, otherwise an error message.
+            TagPages: The author's tags, fetched a page at a time.
 
         """
-        if tags := await TagModel.filter(guild_id=self.guild_id, author_id=self.author_id):
-            return "\n".join(
-                    f"{i+1}. `{name}`"
-                    for i, name in enumerate(
-                        tag.tag_name for tag in tags
-                    )
-                )
-        else:
-            return "Member don't have any tags"
+        return TagPages(self.guild_id, self.author_id)
 
     async def claim(self, tag_name, new_author_id) -> str:
         """Claims ownership of a tag.
@@ -268,8 +1134,9 @@ class Tags:
             str: A message indicating the status of the ownership claim.
 
         """
-        if tag := await TagModel.get_or_none(tag_name=tag_name, guild_id=self.guild_id):
-            await tag.update_from_dict({"author_id": new_author_id}).save()
+        if tag := await TagModel.filter(named(tag_name), guild_id=self.guild_id).first():
+            await tag.update_from_dict({"author_id": new_author_id}).save(update_fields=["author_id"])
+            self._invalidate()
             return "Updated owner"
         else:
             return "Tag doesn't exists"
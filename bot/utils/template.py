@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import discord
+
+from typing import Dict, List, Mapping, Optional, Tuple
+
+
+__all__ = ("Template", "compile_template", "template_variables")
+
+
+# the variables a template can use, anything else in braces is left as written
+VARIABLES = frozenset({
+    "user", "user.name", "user.id", "user.mention",
+    "channel", "channel.id", "channel.mention",
+    "server", "server.id",
+    "args",
+})
+
+# instruction opcodes
+TEXT, VAR, BRANCH, JUMP = range(4)
+
+
+def _variable(name: str) -> bool:
+    # args.1, args.2, ... are the words after the tag name
+    if name.startswith("args."):
+        return name[5:].isdigit() and name[5:] != "0"
+    return name in VARIABLES
+
+
+def _condition(source: str) -> Optional[Tuple[str, Optional[str], str]]:
+    # "name", "name = value" or "name != value"
+    for op in ("!=", "="):
+        name, found, value = source.partition(op)
+        if found:
+            name = name.strip()
+            return (name, op, value.strip().lower()) if _variable(name) else None
+    name = source.strip()
+    return (name, None, "") if _variable(name) else None
+
+
+class Template:
+    """A tag body compiled into a flat list of instructions.
+
+    Rendering walks the instructions once, branches only ever jump forward,
+    so a render is linear in the size of the output. Bodies without any
+    variables keep their text and render to it directly.
+
+    Args:
+        code: The compiled instructions.
+        arguments: Whether the template uses ``{args.N}``.
+    """
+
+    __slots__ = ("code", "arguments", "static")
+
+    def __init__(self, code: List[tuple], arguments: bool = False) -> None:
+        self.code = tuple(code)
+        self.arguments = arguments
+        self.static: Optional[str] = None
+        if not self.code:
+            self.static = ""
+        elif len(self.code) == 1 and self.code[0][0] == TEXT:
+            self.static = self.code[0][1]
+
+    def render(self, variables: Mapping[str, str], args: str = "") -> str:
+        """Renders the template.
+
+        Args:
+            variables: The values of the variables, see :func:`template_variables`.
+            args: What was written after the tag name.
+
+        Returns:
+            str: The rendered text, variables without a value render as nothing.
+        """
+        if self.static is not None:
+            return self.static
+        values = dict(variables, args=args)
+        if self.arguments:
+            values.update((f"args.{i}", arg) for i, arg in enumerate(args.split(), 1))
+
+        out = []
+        code = self.code
+        pc = 0
+        while pc < len(code):
+            instruction = code[pc]
+            kind = instruction[0]
+            if kind == TEXT:
+                out.append(instruction[1])
+            elif kind == VAR:
+                out.append(values.get(instruction[1], ""))
+            elif kind == JUMP:
+                pc = instruction[1]
+                continue
+            else:
+                _, name, op, expected, target = instruction
+                value = values.get(name, "")
+                if op is None:
+                    holds = bool(value.strip())
+                else:
+                    holds = (value.strip().lower() == expected) == (op == "=")
+                if not holds:
+                    pc = target
+                    continue
+            pc += 1
+        return "".join(out)
+
+
+def compile_template(source: str) -> Template:
+    """Compiles a tag body into a :class:`Template`.
+
+    ``{name}`` is replaced by a variable, ``{if name}``, ``{if name = value}``
+    and ``{if name != value}`` start a block that can have an ``{else}`` and
+    ends at ``{end}``. ``{{`` and ``}}`` write a literal brace, other braces
+    that aren't any of these are kept as written, and unclosed blocks end
+    with the body.
+
+    Args:
+        source: The tag's content.
+
+    Returns:
+        Template: The compiled template.
+    """
+    code: List[list] = []
+    # open blocks, each the index of its branch and of the jump over its else
+    blocks: List[List[Optional[int]]] = []
+    arguments = False
+    # index of the last jump target, text can't be merged into an instruction before it
+    target = 0
+    start = 0
+    text = ""
+
+    def emit(instruction: list) -> None:
+        nonlocal text
+        if text:
+            if code and code[-1][0] == TEXT and len(code) > target:
+                code[-1][1] += text
+            else:
+                code.append([TEXT, text])
+            text = ""
+        if instruction:
+            code.append(instruction)
+
+    escaped = -1
+    while True:
+        if escaped < start:
+            escaped = source.find("}}", start)
+        opening = source.find("{", start)
+        # a doubled closing brace before the next tag is a literal one
+        if escaped != -1 and (opening == -1 or escaped < opening):
+            text += source[start:escaped + 1]
+            start = escaped + 2
+            continue
+        if opening == -1:
+            break
+        if source.startswith("{{", opening):
+            text += source[start:opening + 1]
+            start = opening + 2
+            continue
+        closing = source.find("}", opening + 1)
+        if closing == -1:
+            break
+        inner = source[opening + 1:closing]
+        # a brace inside the braces means the first one wasn't a tag, e.g. "{ a {user}"
+        if "{" in inner:
+            text += source[start:opening + 1]
+            start = opening + 1
+            continue
+        text += source[start:opening]
+        start = closing + 1
+        token = inner.strip()
+
+        if _variable(token):
+            arguments = arguments or token.startswith("args.")
+            emit([VAR, token])
+        elif token.startswith("if ") and (condition := _condition(token[3:])):
+            arguments = arguments or condition[0].startswith("args.")
+            emit([BRANCH, *condition, None])
+            blocks.append([len(code) - 1, None])
+        elif token == "else" and blocks and blocks[-1][1] is None:
+            emit([JUMP, None])
+            blocks[-1][1] = len(code) - 1
+            code[blocks[-1][0]][4] = target = len(code)
+        elif token == "end" and blocks:
+            emit([])
+            branch, jump = blocks.pop()
+            code[branch if jump is None else jump][-1] = target = len(code)
+        else:
+            text += source[opening:closing + 1]
+
+    text += source[start:]
+    emit([])
+    for branch, jump in blocks:
+        code[branch if jump is None else jump][-1] = len(code)
+    return Template([tuple(instruction) for instruction in code], arguments)
+
+
+def template_variables(user: discord.abc.User, channel: discord.abc.Messageable, guild: Optional[discord.Guild]) -> Dict[str, str]:
+    """The variables a tag is rendered with for one invocation, apart from its arguments."""
+    variables = {
+        "user": user.display_name,
+        "user.name": user.name,
+        "user.id": str(user.id),
+        "user.mention": user.mention,
+        "channel": getattr(channel, "name", None) or "",
+        "channel.id": str(getattr(channel, "id", "")),
+        "channel.mention": getattr(channel, "mention", None) or "",
+    }
+    if guild is not None:
+        variables.update({"server": guild.name, "server.id": str(guild.id)})
+    return variables
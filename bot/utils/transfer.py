@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import aiohttp
+import csv
+import discord
+import gzip
+import io
+import json
+import zlib
+
+from tempfile import SpooledTemporaryFile
+from typing import Any, AsyncIterator, Dict, Iterable, List
+
+
+__all__ = ("stream_lines", "stream_records", "chunked", "RecordWriter")
+
+
+async def stream_lines(url: str, *, compressed: bool = False) -> AsyncIterator[str]:
+    """Streams a remote text file line by line without holding it in memory.
+
+    Args:
+        url: The URL of the file, e.g. a Discord attachment.
+        compressed: Whether the file is gzip compressed.
+    """
+    # 16 + MAX_WBITS only accepts a gzip header
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compressed else None
+    buffer = b""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                buffer += decompressor.decompress(chunk) if decompressor else chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    yield line.decode("utf-8")
+    if decompressor:
+        buffer += decompressor.flush()
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+async def stream_records(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[Dict[str, Any]]:
+    """Parses JSON Lines (``jsonl``) or ``csv`` lines into dictionaries.
+
+    CSV files need a header row and can't contain line breaks inside fields.
+    Blank lines are skipped.
+    """
+    header = None
+    async for line in lines:
+        if not line.strip():
+            continue
+        if fmt == "jsonl":
+            yield json.loads(line)
+        elif header is None:
+            header = next(csv.reader([line]))
+        else:
+            yield dict(zip(header, next(csv.reader([line]))))
+
+
+async def chunked(records: AsyncIterator[Dict[str, Any]], size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Groups an async stream of records into lists of at most ``size``."""
+    chunk: List[Dict[str, Any]] = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class RecordWriter:
+    """Writes records into a gzip compressed JSON Lines or CSV file.
+
+    The file is spooled to disk once it grows past ``max_memory`` bytes, so
+    exports never have to hold the whole data set in memory.
+
+    Args:
+        fields: The keys written for every record, in order.
+        fmt: Either ``jsonl`` or ``csv``.
+        max_memory: How many compressed bytes are kept in memory before spooling to disk.
+    """
+
+    def __init__(self, fields: Iterable[str], fmt: str = "jsonl", *, max_memory: int = 4 * 1024 * 1024) -> None:
+        self.fields = list(fields)
+        self.fmt = fmt
+        self.count = 0
+        self._file = SpooledTemporaryFile(max_size=max_memory)
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode="wb")
+        self._text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+        self._csv = csv.writer(self._text) if fmt == "csv" else None
+        if self._csv:
+            self._csv.writerow(self.fields)
+
+    def write(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Appends records to the file."""
+        for record in records:
+            if self._csv:
+                self._csv.writerow([record.get(field) for field in self.fields])
+            else:
+                self._text.write(json.dumps({field: record.get(field) for field in self.fields}) + "\n")
+            self.count += 1
+
+    def file(self, name: str) -> discord.File:
+        """Finishes the file and wraps it for sending, ``.gz`` is appended to ``name``."""
+        self._text.flush()
+        self._text.detach()
+        self._gzip.close()
+        self._file.seek(0)
+        return discord.File(self._file, filename=f"{name}.{self.fmt}.gz")
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import asyncio
+import pytest
+
+from tortoise import Tortoise
+from typing import Any, Awaitable, Callable
+
+from bot.db.migrations import migrate
+from bot.utils.cache import TTLCache
+from bot.utils.tag import TagCache, TagNameIndex, TagPages, Tags, TagTriggers, TagUsage
+
+
+@pytest.fixture(autouse=True)
+def tag_state(monkeypatch) -> None:
+    """Gives every test its own shared tag state, ids start over with every database."""
+    monkeypatch.setattr(Tags, "cache", TagCache())
+    monkeypatch.setattr(Tags, "names", TagNameIndex())
+    monkeypatch.setattr(Tags, "triggers", TagTriggers())
+    monkeypatch.setattr(Tags, "usage", TagUsage())
+    monkeypatch.setattr(TagPages, "cache", TTLCache(ttl=30, max_size=1024))
+
+
+@pytest.fixture
+def run() -> Callable[[Callable[[], Awaitable[Any]]], Any]:
+    """Runs a coroutine function against a fresh in-memory database."""
+    def runner(test: Callable[[], Awaitable[Any]]) -> Any:
+        async def wrapped():
+            await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["bot.db.database"]})
+            await Tortoise.generate_schemas()
+            await migrate()
+            try:
+                return await test()
+            finally:
+                await Tortoise.close_connections()
+
+        return asyncio.run(wrapped())
+
+    return runner
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from bot.cogs.ext import ExtraCog
+from bot.utils.tag import Tags
+
+
+class Channel:
+    id = 3
+    name = "general"
+    mention = "<#3>"
+
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+def message(content: str, channel: Channel):
+    author = SimpleNamespace(id=2, bot=False, name="bob", display_name="Bob", mention="<@2>")
+    return SimpleNamespace(content=content, author=author, channel=channel, guild=SimpleNamespace(id=25, name="Server"))
+
+
+def bot(command=None):
+    async def get_context(_message):
+        return SimpleNamespace(command=command)
+
+    return SimpleNamespace(get_context=get_context)
+
+
+def test_trigger_responds(run):
+    async def test():
+        await Tags(25, 1).create("hello", "Hello there")
+        await Tags(25, 1).add_trigger("hello", "hi")
+        channel = Channel()
+
+        await ExtraCog(bot()).on_message(message("hi everyone", channel))
+
+        assert channel.sent == ["Hello there"]
+
+    run(test)
+
+
+def test_trigger_ignores_commands(run):
+    async def test():
+        await Tags(25, 1).create("hello", "Hello there")
+        await Tags(25, 1).add_trigger("hello", "hello")
+        channel = Channel()
+
+        await ExtraCog(bot(command=object())).on_message(message(">tag delete_trigger hello", channel))
+
+        assert channel.sent == []
+
+    run(test)
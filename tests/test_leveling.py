@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+import pytest
+
+from bot.db.database import GlobalLeveling, LevelingSeason, LevelingSystem
+from bot.utils.leveling import Leveling, LevelingSeasons, LevelingTransfer
+
+
+async def records(*items):
+    for item in items:
+        yield item
+
+
+def test_import_stopped_partway_updates_ranks(run, monkeypatch):
+    monkeypatch.setattr(LevelingTransfer, "CHUNK_SIZE", 1)
+
+    async def test():
+        await Leveling(12, 1).create_user()
+        # loads the rank index before the import
+        assert await Leveling(12, 1).get_rank() == 1
+
+        with pytest.raises(KeyError):
+            await LevelingTransfer(12).import_records(records({"user_id": 2, "total_xp": 1000}, {"total_xp": 5}))
+
+        assert await Leveling(12, 2).get_rank() == 1
+        assert await Leveling(12, 1).get_rank() == 2
+
+    run(test)
+
+
+def test_flush_upserts_members(run):
+    async def test():
+        await Leveling(2, 1).create_user()
+        await LevelingSystem.filter(guild_id=2, user_id=1).update(multiplier=3)
+        Leveling.buffer.add(2, 1, 10)
+        Leveling.buffer.add(2, 2, 150)
+        Leveling.buffer.add(3, 1, 5)
+
+        assert await Leveling.buffer.flush(2) == 2
+        assert len(Leveling.buffer) == 1
+        rows = {row["user_id"]: row for row in await LevelingSystem.filter(guild_id=2).values("user_id", "total_xp", "level", "xp")}
+        assert rows[1]["total_xp"] == 30
+        assert (rows[2]["total_xp"], rows[2]["level"], rows[2]["xp"]) == (150, 2, 50)
+        assert await GlobalLeveling.get(user_id=1).values_list("total_xp", flat=True) == 30
+
+        await Leveling.buffer.flush()
+        assert await Leveling(2, 1).create_user() == "User already exists"
+        assert await LevelingSystem.filter(user_id=1).count() == 2
+
+    run(test)
+
+
+def test_concurrent_resets_archive_separate_seasons(run):
+    async def test():
+        await Leveling(14, 1).create_user()
+        first, second = await asyncio.gather(LevelingSeasons(14).reset(), LevelingSeasons(14).reset())
+
+        assert {first[0], second[0]} == {1, 2}
+        assert await LevelingSeason.filter(guild_id=14).count() == 2
+        assert await LevelingSeasons(14).current() == 3
+
+    run(test)
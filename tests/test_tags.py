@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import discord
+import pytest
+
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+from types import SimpleNamespace
+
+from bot.cogs.tags import TagCog
+from bot.utils.tag import TagCache, Tags, TagTransfer
+
+
+async def records(*items):
+    for item in items:
+        yield item
+
+
+def test_import_stopped_partway_keeps_imported_tags_visible(run, monkeypatch):
+    monkeypatch.setattr(TagTransfer, "CHUNK_SIZE", 1)
+
+    async def test():
+        tags = Tags(21, 1)
+        # loads the guild into the cache before the import
+        assert (await tags.get("imported")).startswith("Tag Doesn't Exists")
+
+        with pytest.raises(KeyError):
+            await TagTransfer(21, 1).import_records(records({"tag_name": "imported", "content": "hi"}, {"content": "no name"}))
+
+        assert await tags.get("imported") == "hi"
+        assert await tags.create("imported", "again") == "Tag already exists"
+
+    run(test)
+
+
+
+def test_import_full_chunk_skips_missing_content(run):
+    async def test():
+        items = [{"tag_name": f"tag{i}", "content": str(i)} for i in range(TagTransfer.CHUNK_SIZE)]
+        items += [{"tag_name": "empty", "content": None}, {"tag_name": "missing"}]
+
+        assert await TagTransfer(21, 1).import_records(records(*items)) == (TagTransfer.CHUNK_SIZE, 2)
+        assert (await Tags(21, 1).get("empty")).startswith("Tag Doesn't Exists")
+
+    run(test)
+
+def test_existing_tags_are_not_templates(run):
+    code = "def greet():\n    return f\"hi {user}, {args}\"\n"
+
+    async def test():
+        tags = Tags(24, 1)
+        await tags.create("greet", code)
+        variables = {"user": "Bob"}
+
+        assert await tags.get("greet", variables) == code
+        assert (await tags.get("greet extra", variables)).startswith("Tag Doesn't Exists")
+
+        assert await tags.set_template("greet", True) == "`greet` is now a template"
+        assert await tags.get("greet x", variables) == "def greet():\n    return f\"hi Bob, x\"\n"
+        assert await tags.get("greet") == code
+
+    run(test)
+
+
+def test_template_escapes_braces(run):
+    async def test():
+        tags = Tags(24, 1)
+        await tags.create("escaped", "{{user}} is {user}")
+        await tags.set_template("escaped", True)
+
+        assert await tags.get("escaped", {"user": "Bob"}) == "{user} is Bob"
+
+    run(test)
+
+
+def test_grep_fits_in_a_message(run):
+    async def test():
+        tags = Tags(17, 1)
+        for i in range(10):
+            await tags.create(f"long{i}", "needle " + " ".join(["x" * 200] * 12))
+
+        result = await tags.grep("needle")
+        assert len(result) <= 2000
+        assert result.startswith("1. `long")
+        assert result.endswith("more")
+
+    run(test)
+
+
+def test_oversized_guild_is_not_reloaded(run, monkeypatch):
+    cache = TagCache(max_bytes=10)
+    monkeypatch.setattr(Tags, "cache", cache)
+    loads = []
+    load = cache._load
+
+    async def counted(guild_id):
+        loads.append(guild_id)
+        return await load(guild_id)
+
+    monkeypatch.setattr(cache, "_load", counted)
+
+    async def test():
+        tags = Tags(15, 1)
+        await tags.create("big", "more than ten bytes")
+        for _ in range(5):
+            assert await tags.get("big") == "more than ten bytes"
+        assert len(loads) == 1
+
+        # an edit can shrink the guild enough to be cached again
+        await tags.edit("big", "small")
+        assert await tags.get("big") == "small"
+        assert await tags.get("big") == "small"
+        assert len(loads) == 2 and len(cache) == 1
+
+    run(test)
+
+
+def test_tag_subcommands_need_a_guild(run):
+    async def test():
+        bot = commands.Bot(command_prefix=">", intents=discord.Intents.none())
+        await bot.add_cog(TagCog(bot))
+        try:
+            author = SimpleNamespace(id=2, bot=False)
+            message = SimpleNamespace(content=">tag create hello hi", author=author, channel=SimpleNamespace(id=3), guild=None, attachments=[], _state=None)
+            view = StringView(message.content)
+            view.skip_string(">")
+            ctx = commands.Context(message=message, bot=bot, view=view, prefix=">")
+            ctx.invoked_with = view.get_word()
+            ctx.command = bot.all_commands[ctx.invoked_with]
+
+            with pytest.raises(commands.NoPrivateMessage):
+                await ctx.command.invoke(ctx)
+        finally:
+            await bot.remove_cog("TagCog")
+
+    run(test)